@@ -1,5 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from graphviz import Digraph
+import graphviz
+import io
+import os
 from ordered_set import OrderedSet
 #import pyddl
 import re
@@ -17,6 +21,28 @@ def getAlphabet(stack):
             for elem in item:
                 yield elem
 
+# identifiers which need no quoting in dot language (same rules as graphviz.quoting)
+DOT_ID = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*|-?(\.[0-9]+|[0-9]+(\.[0-9]*)?))$')
+DOT_KEYWORDS = set(['node','edge','graph','digraph','subgraph','strict'])
+DOT_UNESCAPED_QUOTE = re.compile(r'(?P<bs>(?:\\{2})*)\\?(?P<q>")')
+
+def dotQuote(identifier):
+    '''Return dot identifier from string, quote if needed (see graphviz.quoting.quote).'''
+    if DOT_ID.match(identifier) and not (identifier.lower() in DOT_KEYWORDS):
+        return identifier
+    return '"{}"'.format(DOT_UNESCAPED_QUOTE.sub(r'\g<bs>\\\g<q>',identifier))
+
+def dotQuoteEdge(identifier):
+    '''Return dot node ID used in edge statement - part after ':' is port (see graphviz.quoting.quote_edge).'''
+    (node,sep,rest) = identifier.partition(':')
+    parts = [dotQuote(node)]
+    if rest:
+        (port,sep,compass) = rest.partition(':')
+        parts.append(dotQuote(port))
+        if compass:
+            parts.append(compass)
+    return ':'.join(parts)
+
 def getArgPositions(argName,actInstanceList):
     """Returns list of positions taken by given argument in action instances in the list."""
     res = {}
@@ -46,6 +72,9 @@ class FSA(object):
         self._goals = []
         self._transitions = [] # list of tuples (origState,action,destState)
                                # orig/destState .. int, action .. (aName,argList)
+        # successor index used for plan simulation {state:{aName:set(destStates)}}
+        # built lazily and dropped whenever a transition is added
+        self._successors = None
 
     @staticmethod
     def initFromStack(stack):
@@ -82,6 +111,10 @@ class FSA(object):
                 # handle action set
                 FSA.handleSet(sym,stack,status)
 
+        # states are numbered from 0 (see handleAction and handleSet)
+        if len(A._states) > 0:
+            A._init = 0
+
         # State arguments can be initialized before merging into the domain
         # as well as lambda transition arguments
 
@@ -273,6 +306,42 @@ class FSA(object):
     def transitions(self):
         return self._transitions
 
+    def toDict(self):
+        '''Return JSON compatible description of the automaton (see model.py).'''
+        transitions = []
+        for (orig,(aName,args),dest) in self._transitions:
+            transitions.append([orig,aName,None if args == None else list(args),dest])
+
+        return {'states':list(self._states),
+                'init':self._init,
+                'goals':list(self._goals),
+                'alphabet':sorted(self._alphabet),
+                'stateArgs':dict([(str(s),list(self._state_data[s].args)) for s in self._states]),
+                'transitions':transitions}
+
+    @staticmethod
+    def fromDict(data):
+        '''Initialize FSA from description produced by toDict.'''
+        A = FSA()
+        for s in data['states']:
+            A._states.append(s)
+            A._state_data[s] = FSAState(s,A)
+            A._state_data[s].args = list(data['stateArgs'].get(str(s),[]))
+        A._init = data['init']
+        A._goals = list(data['goals'])
+        A._alphabet = set(data['alphabet'])
+        for (orig,aName,args,dest) in data['transitions']:
+            # lambda arguments are filled in later (see initializeLambdaTransArgs) - keep them mutable
+            if args == None:
+                act = (aName,None)
+            elif aName.startswith(FSA.LAMBDA_PREF):
+                act = (aName,args)
+            else:
+                act = (aName,tuple(args))
+            A._transitions.append((orig,act,dest))
+
+        return A
+
     def filterTransitions(self,baseState,incoming):
         for (orig,act,dest) in self._transitions:
             if incoming:
@@ -491,6 +560,7 @@ class FSA(object):
 
         if not (T in self._transitions):
             self._transitions.append(T)
+            self._successors = None
 
     def markGoal(self,goalStateID):
         '''Mark goalStateID as goal state in the automaton.'''
@@ -498,50 +568,188 @@ class FSA(object):
 
         self._goals.append(goalStateID)
 
-    def buildGraph(self):
-        sPref = 's'
+    def successorMap(self):
+        '''Return map {state:{aName:set(destStates)}} of all transitions (lambda transitions included).'''
+        if self._successors == None:
+            succ = {}
+            for (orig,(aName,args),dest) in self._transitions:
+                succ.setdefault(orig,{}).setdefault(aName,set()).add(dest)
+            self._successors = succ
+
+        return self._successors
+
+    def lambdaClosure(self,stateSet):
+        '''Return stateSet extended with all states reachable through lambda transitions.'''
+        succ = self.successorMap()
+        res = set(stateSet)
+        toVisit = list(stateSet)
+        while len(toVisit) > 0:
+            s = toVisit.pop()
+            for (aName,destSet) in succ.get(s,{}).items():
+                if aName.startswith(FSA.LAMBDA_PREF):
+                    for d in destSet:
+                        if not (d in res):
+                            res.add(d)
+                            toVisit.append(d)
+        return res
+
+    def finalStates(self):
+        '''Return set of accepting states.
+           Goal states are used if marked, otherwise the last state created from the stack.'''
+        if len(self._goals) > 0:
+            return set(self._goals)
+        elif len(self._states) > 0:
+            return set([max(self._states)])
+        else:
+            return set()
+
+    def simulate(self,actionNames):
+        '''Run the automaton on a sequence of action names.
+           Returns triple (accepted,deviation,stateList) where:
+           accepted .. True iff the whole sequence was read and an accepting state was reached
+           deviation .. index of the first action without matching transition
+                        (len(actionNames) if the sequence was read but not accepted, None if accepted)
+           stateList .. sorted list of states reached before the deviation (or at the end)'''
+        succ = self.successorMap()
+        current = self.lambdaClosure([self._init])
+        for (i,aName) in enumerate(actionNames):
+            nextSet = set()
+            for s in current:
+                nextSet.update(succ.get(s,{}).get(aName,()))
+            if len(nextSet) == 0:
+                return (False,i,sorted(current))
+            current = self.lambdaClosure(nextSet)
+
+        if len(current & self.finalStates()) > 0:
+            return (True,None,sorted(current))
+        else:
+            return (False,len(actionNames),sorted(current))
+
+    def determinize(self):
+        '''Subset construction of equivalent deterministic automaton without lambda transitions.
+           Returns triple (stateSets,transitions,accepting) where:
+           stateSets .. list of frozensets of FSA states, index in the list is the DFA state ID (0 is initial)
+           transitions .. {(dfaState,aName):dfaState}
+           accepting .. set of accepting DFA state IDs'''
+        succ = self.successorMap()
+        finals = self.finalStates()
+
+        start = frozenset(self.lambdaClosure([self._init]))
+        stateSets = [start]
+        stateIDs = {start:0}
+        transitions = {}
+        toVisit = [start]
+        while len(toVisit) > 0:
+            current = toVisit.pop(0)
+            # collect successors for each ordinary action name
+            moves = {}
+            for s in current:
+                for (aName,destSet) in succ.get(s,{}).items():
+                    if not aName.startswith(FSA.LAMBDA_PREF):
+                        moves.setdefault(aName,set()).update(destSet)
+
+            for aName in sorted(moves):
+                dest = frozenset(self.lambdaClosure(moves[aName]))
+                if not (dest in stateIDs):
+                    stateIDs[dest] = len(stateSets)
+                    stateSets.append(dest)
+                    toVisit.append(dest)
+                transitions[(stateIDs[current],aName)] = stateIDs[dest]
+
+        accepting = set([i for (i,S) in enumerate(stateSets) if len(S & finals) > 0])
+
+        return (stateSets,transitions,accepting)
+
+    def stateLabel(self,s,sPref='s'):
+        '''Diagram label of state s, e.g. (s3 ?x1 ?x4)'''
+        args = self._state_data[s].args
+        if len(args) == 0:
+            return '({}{})'.format(sPref,s)
+        else:
+            argStr =  ' '.join(str(a) for a in args)
+            return '({}{} {})'.format(sPref,s,argStr)
 
+    @staticmethod
+    def transitionLabel(act):
+        '''Diagram label of transition action, e.g. (load ?x1 ?x2) or (drive -)'''
+        (aName,args) = act
+        if (args == None) or (len(args) == 0):
+            return '({} -)'.format(aName)
+        else:
+            argStr = ' '.join(str(a) for a in args)
+            return '({} {})'.format(aName,argStr)
+
+    def buildGraph(self):
         f = Digraph('FSA')
 
         # nodes
         f.attr('node', shape='circle')
         labelMap = {}
         for s in self._states:
-            args = self._state_data[s].args
-            if len(args) == 0:
-                nodeLabel = '({}{})'.format(sPref,s)
-            else:
-                argStr =  ' '.join(str(a) for a in args)
-                nodeLabel = '({}{} {})'.format(sPref,s,argStr)
-
+            nodeLabel = self.stateLabel(s)
             labelMap[s] = nodeLabel
             f.node(nodeLabel)
 
         # edges
         for (orig,act,dest) in self._transitions:
-            origLabel = labelMap[orig]
-            destLabel = labelMap[dest]
-            (aName,args) = act
-            if (args == None) or (len(args) == 0):
-                edgeLabel = '({} -)'.format(aName)
-            else:
-                argStr = ' '.join(str(a) for a in args)
-                edgeLabel = '({} {})'.format(aName,argStr)
-
-            f.edge(origLabel,destLabel,edgeLabel)
+            f.edge(labelMap[orig],labelMap[dest],FSA.transitionLabel(act))
 
         return f
 
+    def writeDot(self,out):
+        '''Write diagram source in dot format line by line to file handle out.
+           The output is the same as buildGraph().source without building graphviz.Digraph.'''
+        out.write('digraph FSA {\n')
+        out.write('\tnode [shape=circle]\n')
+
+        # nodes
+        labelMap = {}
+        for s in self._states:
+            nodeLabel = self.stateLabel(s)
+            labelMap[s] = dotQuoteEdge(nodeLabel)
+            out.write('\t{}\n'.format(dotQuote(nodeLabel)))
+
+        # edges
+        for (orig,act,dest) in self._transitions:
+            edgeLabel = dotQuote(FSA.transitionLabel(act))
+            out.write('\t{} -> {} [label={}]\n'.format(labelMap[orig],labelMap[dest],edgeLabel))
+
+        out.write('}\n')
+
     def render(self,diagramFile,diagramFormat):
         g = self.buildGraph()
 
         g.render(filename=diagramFile,format=diagramFormat,formatter='cairo',renderer='cairo',cleanup=True)
 
+    def renderFormats(self,diagramFile,diagramFormats,workers=None):
+        '''Render diagram to diagramFile.FORMAT for each format from diagramFormats (gv,png,svg,pdf).
+           Dot source is built once, graphviz layout runs concurrently in at most workers processes.
+           Returns list of written files.'''
+        source = self.__repr__()
+        data = source.encode('utf-8')
+
+        def renderOne(diagramFormat):
+            filename = '{}.{}'.format(diagramFile,diagramFormat)
+            if diagramFormat == 'gv':
+                with open(filename,'w',encoding='utf-8') as dotFile:
+                    dotFile.write(source)
+            else:
+                # graphviz subprocess - the thread only waits for it
+                image = graphviz.pipe('dot',diagramFormat,data,renderer='cairo',formatter='cairo')
+                with open(filename,'wb') as imageFile:
+                    imageFile.write(image)
+            return filename
+
+        if workers == None:
+            workers = min(len(diagramFormats),os.cpu_count() or 1)
+
+        with ThreadPoolExecutor(max_workers=max(1,workers)) as pool:
+            return list(pool.map(renderOne,diagramFormats))
+
     def saveDiagram(self,filename):
         '''Save diagram source'''
-        g = self.buildGraph()
-
-        g.save(filename)
+        with open(filename,'w',encoding='utf-8') as dotFile:
+            self.writeDot(dotFile)
 
 #    @staticmethod
 #    def renameArguments(pddlAction,fsaAction):
@@ -723,6 +931,7 @@ class FSA(object):
     def __repr__(self):
         '''Print textual representation of given FSA in dot format.
         '''
-        g = self.buildGraph()
+        out = io.StringIO()
+        self.writeDot(out)
 
-        return g.source
+        return out.getvalue()
@@ -0,0 +1,453 @@
+#!/usr/bin/python3
+
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+# option parsing
+from optparse import OptionParser
+
+import events
+import readplans
+import refle
+from checkpoint import LearningCheckpoint
+from corpusstore import CorpusStore
+from FSA import FSA
+from model import saveModel, loadFullModel
+from pattern import Pattern, getComponents
+from plangen import PlanGenerator, writePlanDir
+from planindex import indexPlans
+from plantrie import triePlans
+from reexport import PlanRegex
+from retree import PlanRETree
+from sampling import SplitSampling
+from selector import selectAction
+
+def timeIt(function,repeat):
+    '''Return best wall time of repeated function calls in seconds.'''
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if (best == None) or (elapsed < best):
+            best = elapsed
+    return best
+
+########## tokenizer ########
+
+def legacyParseLine(line):
+    '''Per-line parsing used by readplans before parsePlanLines tokenizer (plain "(action arg ...)" lines only).'''
+    strLine = line.strip('()\n')
+    if len(strLine) == 0:
+        return None
+    tokens = strLine.split(' ')
+    if len(tokens) > 1:
+        return tuple([tokens[0],tuple(tokens[1:])])
+    else:
+        return tuple([tokens[0],tuple()])
+
+def planLines(lineCnt,timestamped,seed=0):
+    '''Generate plan lines - plain "(drive t1 p0 p1)" or planner output "0.000: (drive t1 p0 p1) [1.000]" with comments.'''
+    rnd = random.Random(seed)
+    names = ['drive','lift','drop','load','unload']
+    lines = []
+    for i in range(lineCnt):
+        args = ' '.join(['o{}'.format(rnd.randrange(100)) for j in range(rnd.randint(0,4))])
+        action = '({} {})'.format(rnd.choice(names),args) if len(args) > 0 else '({})'.format(rnd.choice(names))
+        if timestamped:
+            lines.append('{:.3f}: {} [1.000]\n'.format(i,action))
+            if (i % 50) == 0:
+                lines.append('; cost = {}\n'.format(i))
+        else:
+            lines.append(action + '\n')
+    return lines
+
+def benchTokenizer(options):
+    plainLines = planLines(options.lines,False)
+    plannerLines = planLines(options.lines,True)
+
+    results = {}
+    results['legacy_plain'] = timeIt(lambda:[legacyParseLine(l) for l in plainLines],options.repeat)
+    results['tokenize_plain'] = timeIt(lambda:readplans.parsePlanLines(plainLines),options.repeat)
+    results['tokenize_planner'] = timeIt(lambda:readplans.parsePlanLines(plannerLines),options.repeat)
+    results['tokenize_planner_lower'] = timeIt(lambda:readplans.parsePlanLines(plannerLines,True),options.repeat)
+
+    # both paths have to agree on the format the legacy parser understands
+    assert [legacyParseLine(l) for l in plainLines] == readplans.parsePlanLines(plainLines)
+
+    return dict([(k,{'seconds':t,'linesPerSecond':options.lines / t}) for (k,t) in results.items()])
+
+########## corpus containers ########
+
+def benchCorpus(options):
+    '''Convert plan directory (plain and compressed files) to corpus containers and read them back.'''
+    gen = PlanGenerator(options.actions,options.arity,options.length,options.bodyRepeat,options.objects,options.seed,options.setup)
+    plans = gen.plans(options.plans)
+    expr = readplans.PlanFilter(re.compile('plan'))
+
+    workDir = tempfile.mkdtemp(prefix='dcklearn-corpus-')
+    try:
+        planDir = os.path.join(workDir,'plans')
+        # every second plan file is compressed
+        writePlanDir(plans,planDir,2)
+        namedPlans = list(readplans.iterPlans(planDir,expr))
+        assert [p for (name,p) in namedPlans] == plans
+        sources = [('directory',planDir)]
+        for suffix in ('.tar','.tar.gz','.jsonl','.jsonl.gz'):
+            corpusFile = os.path.join(workDir,'corpus' + suffix)
+            readplans.convertPlanDir(planDir,expr,corpusFile)
+            sources.append((suffix[1:],corpusFile))
+
+        results = {}
+        for (name,source) in sources:
+            # every container gives back the plans under their names without compression suffix
+            assert list(readplans.iterPlans(source,expr)) == namedPlans, name
+            results['read_' + name] = {'seconds':timeIt(lambda:list(readplans.iterPlans(source,expr)),options.repeat)}
+    finally:
+        shutil.rmtree(workDir)
+    return results
+
+########## learning pipeline ########
+
+def quiet(function):
+    '''Wrap function so that learner events (progress of makeRE, labels of labelActions ...) are not emitted while it runs.'''
+    def call():
+        sinks = events.sinks
+        events.configure([])
+        try:
+            return function()
+        finally:
+            events.configure(sinks)
+    return call
+
+def patternFragments(plans,signature,fragmentLen=4):
+    '''Patterns of consecutive plan fragments sharing one border action (input of Pattern.connectPatterns).
+       All plans have to have the same action sequence.'''
+    planLen = len(plans[0])
+    res = []
+    for start in range(0,planLen - 1,fragmentLen - 1):
+        end = min(planLen,start + fragmentLen)
+        res.append(Pattern.fromplans([p[start:end] for p in plans],signature))
+    return res
+
+def mutatedPlans(plans,seed=0):
+    '''Unseen plans - copy of each plan with one action deleted, inserted (copy of another action of the plan) or replaced.'''
+    rnd = random.Random(seed)
+    res = []
+    for p in plans:
+        q = list(p)
+        i = rnd.randrange(len(q))
+        change = rnd.randrange(3)
+        if change == 0:
+            del q[i]
+        elif change == 1:
+            q.insert(i,q[rnd.randrange(len(q))])
+        else:
+            q[i] = q[rnd.randrange(len(q))]
+        res.append(q)
+    return res
+
+def processAll(action,trimmedPlans):
+    for p in trimmedPlans:
+        refle.processPlan(action,p,[],[],[])
+
+def benchLearning(options):
+    gen = PlanGenerator(options.actions,options.arity,options.length,options.bodyRepeat,options.objects,options.seed,options.setup)
+    plans = gen.plans(options.plans)
+    signature = refle.getDomainSignature(plans)
+    wrapped = [[(None,None)] + p + [(None,None)] for p in plans]
+    indexed = indexPlans(wrapped)
+    inTrie = triePlans(indexed)
+
+    # inputs of the first split (see refle.makeRE)
+    trimmed = [refle.trimPlan(p) for p in wrapped]
+    actionSet = set([a for p in plans for (a,args) in p])
+    splitDataMap = dict([(a,refle.splitData(a,trimmed)) for a in actionSet])
+    topAction = selectAction(splitDataMap)
+
+    # plans with the same action sequence for pattern functions
+    samePlans = gen.plans(options.plans,options.bodyRepeat)
+    fragments = patternFragments(samePlans,signature)
+    # equivalence sets of all fragments on their positions in the whole plan (as merged by Pattern.connect2)
+    masks = []
+    offset = 0
+    for f in fragments:
+        masks.extend(Pattern.shiftMask(f.equivalenceSets,offset))
+        offset += len(f.sequence) - 1
+
+    # whole pipeline once to get stack and FSA
+    (reTree,pattern) = quiet(lambda:refle.makeRE(wrapped,signature,(True,True,0,None),0))()
+    quiet(reTree.labelActions)()
+    stack = refle.integratePattern2Stack(reTree.__repr__(),pattern)
+    A = FSA.initFromStack(stack)
+
+    # exported expression has to accept the same training plans as the FSA
+    regex = PlanRegex(stack)
+    assert [regex.match(p) for p in plans] == [A.simulate([a for (a,args) in p])[0] for p in plans]
+    # on unseen plans the expression can be stricter (see reexport.PlanRegex) - disagreements are only counted
+    unseen = mutatedPlans(plans,options.seed)
+    unseenFSA = [A.simulate([a for (a,args) in p])[0] for p in unseen]
+    unseenRegex = [regex.match(p) for p in unseen]
+
+    timed = [('makeRE',quiet(lambda:refle.makeRE(wrapped,signature,(True,True,0,None),0))),
+             ('makeRE_indexed',quiet(lambda:refle.makeRE(indexed,signature,(True,True,0,None),0))),
+             ('makeRE_trie',quiet(lambda:refle.makeRE(inTrie,signature,(True,True,0,None),0))),
+             ('indexPlans',lambda:indexPlans(wrapped)),
+             ('triePlans',lambda:triePlans(indexed)),
+             ('splitData',lambda:[refle.splitData(a,trimmed) for a in actionSet]),
+             ('processPlan',lambda:processAll(topAction,trimmed)),
+             ('selectAction',lambda:selectAction(splitDataMap)),
+             ('plans2patt',lambda:Pattern.plans2patt(samePlans)),
+             ('connectPatterns',lambda:Pattern.connectPatterns(fragments,signature)),
+             ('getComponents',lambda:getComponents(masks)),
+             ('initFromStack',lambda:FSA.initFromStack(stack)),
+             ('buildGraph',A.buildGraph)]
+
+    results = dict([(name,{'seconds':timeIt(function,options.repeat)}) for (name,function) in timed])
+    results['sizes'] = {'plans':len(plans),
+                        'actions':sum([len(p) for p in plans]),
+                        'patternFragments':len(fragments),
+                        'masks':len(masks),
+                        'stack':len(stack),
+                        'states':len(A.states),
+                        'transitions':len(A.transitions)}
+    results['regexUnseen'] = {'plans':len(unseen),
+                              'acceptedFSA':sum(unseenFSA),
+                              'acceptedRegex':sum(unseenRegex),
+                              'disagree':len([1 for (f,r) in zip(unseenFSA,unseenRegex) if f != r])}
+    return results
+
+########## sampled split selection ########
+
+def treeAgreement(exact,approx):
+    '''Compare trees given as PlanRETree.toDict dictionaries. Return pair (split nodes of exact tree
+       with the same split action and repetition as approx tree on the same path,all split nodes of exact tree).'''
+    if (exact == None) or ('set' in exact):
+        return (0,0)
+    total = PlanRETree.fromDict(exact).nodeCount()
+    if (approx == None) or ('set' in approx) or ((exact['action'],exact['middleRep']) != (approx['action'],approx['middleRep'])):
+        # subproblems below different split are different
+        return (0,total)
+    same = 1
+    for branch in ('head','middle','tail'):
+        same += treeAgreement(exact[branch],approx[branch])[0]
+    return (same,total)
+
+def learnTree(wrapped,signature,sampling):
+    '''Run makeRE with given sampling (None for exact selection), return (PlanRETree,FSA).'''
+    refle.setSampling(sampling)
+    try:
+        (reTree,pattern) = quiet(lambda:refle.makeRE(wrapped,signature,(True,True,0,None),0))()
+        PlanRETree.index = 0
+        quiet(reTree.labelActions)()
+        A = FSA.initFromStack(refle.integratePattern2Stack(reTree.__repr__(),pattern))
+    finally:
+        refle.setSampling(None)
+    return (reTree,A)
+
+def benchSampling(options):
+    '''Compare trees learned with sampled split selection against the exact selection.'''
+    gen = PlanGenerator(options.actions,options.arity,options.length,options.bodyRepeat,options.objects,options.seed,options.setup)
+    plans = gen.plans(options.plans)
+    signature = refle.getDomainSignature(plans)
+    wrapped = [[(None,None)] + p + [(None,None)] for p in plans]
+
+    modes = [('exact',None)]
+    for top in options.sampleTop:
+        modes.append(('sample{}_top{}'.format(options.sampleSize,top),SplitSampling(options.sampleSize,top,options.seed)))
+
+    results = {}
+    exactTree = None
+    for (name,sampling) in modes:
+        (reTree,A) = learnTree(wrapped,signature,sampling)
+        tree = reTree.toDict()
+        if exactTree == None:
+            exactTree = tree
+        (same,total) = treeAgreement(exactTree,tree)
+        results[name] = {'seconds':timeIt(lambda:learnTree(wrapped,signature,sampling),options.repeat),
+                         'identical':tree == exactTree,
+                         'agreeingNodes':same,
+                         'exactNodes':total,
+                         'nodes':reTree.nodeCount(),
+                         'states':len(A.states),
+                         'transitions':len(A.transitions)}
+    return results
+
+########## self-check ########
+
+class Interrupted(Exception):
+    pass
+
+def interruptAt(cp,leaveCnt):
+    '''Make checkpoint cp raise Interrupted when leaveCnt-th node of makeRE is finished (before it is recorded).'''
+    leave = cp.leave
+    finished = [0]
+    def interrupted(res):
+        finished[0] += 1
+        if finished[0] == leaveCnt:
+            raise Interrupted()
+        leave(res)
+    cp.leave = interrupted
+
+def learnChecked(dataRoot,expr,store=None,cp=None):
+    '''Run refle.learnDomain with checkpoint cp (None for no checkpoint), return (reTree,pattern,combinedStack).'''
+    PlanRETree.index = 0
+    refle.setCheckpoint(cp)
+    try:
+        return quiet(lambda:refle.learnDomain(dataRoot,expr,1,store))()
+    finally:
+        refle.setCheckpoint(None)
+
+def selfCheck(options):
+    '''Check round trips the learner relies on: corpus containers, saved models, checkpoint resume and plan store.
+       Raises AssertionError on the first failed check, returns counts of checked items.'''
+    gen = PlanGenerator(options.actions,options.arity,options.length,options.bodyRepeat,options.objects,options.seed,options.setup)
+    plans = gen.plans(options.plans)
+    # duplicates are collapsed before learning (see refle.collapseDuplicates)
+    plans = plans + plans[:len(plans) // 4]
+    unseen = mutatedPlans(plans,options.seed)
+    expr = readplans.PlanFilter(re.compile('plan'))
+
+    results = {}
+    # plan directory (plain and compressed files) -> tar, tar.gz, jsonl, jsonl.gz -> the same plans
+    results['corpus'] = sorted([name[len('read_'):] for name in benchCorpus(options)])
+
+    workDir = tempfile.mkdtemp(prefix='dcklearn-check-')
+    try:
+        planDir = os.path.join(workDir,'plans')
+        writePlanDir(plans,planDir,2)
+        corpusFile = os.path.join(workDir,'corpus.tar.gz')
+        readplans.convertPlanDir(planDir,expr,corpusFile)
+
+        (reTree,pattern,stack) = learnChecked(planDir,expr)
+        A = FSA.initFromStack(stack)
+        accepted = [A.simulate([a for (a,args) in p]) for p in plans + unseen]
+        assert all([acc for (acc,deviation,states) in accepted[:len(plans)]])
+
+        # saved model gives the same FSA, tree and pattern
+        for fileName in ('model.json','model.json.gz'):
+            modelFile = os.path.join(workDir,fileName)
+            saveModel(modelFile,A,reTree,pattern)
+            (loadedA,loadedTree,loadedPattern) = loadFullModel(modelFile)
+            assert loadedA.toDict() == A.toDict(), fileName
+            assert loadedTree.toDict() == reTree.toDict(), fileName
+            assert loadedPattern.toDict() == pattern.toDict(), fileName
+            assert [loadedA.simulate([a for (a,args) in p]) for p in plans + unseen] == accepted, fileName
+        results['model'] = len(plans + unseen)
+
+        # learning interrupted after some finished nodes continues from checkpoint to the same result
+        cpFile = os.path.join(workDir,'checkpoint.json')
+        nodes = reTree.nodeCount()
+        resumed = []
+        for leaveCnt in sorted(set([2,nodes,2*nodes])):
+            if os.path.exists(cpFile):
+                os.remove(cpFile)
+            cp = LearningCheckpoint(cpFile,0.0)
+            interruptAt(cp,leaveCnt)
+            try:
+                learnChecked(planDir,expr,cp=cp)
+                raise AssertionError('learning was not interrupted at node {}'.format(leaveCnt))
+            except Interrupted:
+                pass
+            cp = quiet(lambda:LearningCheckpoint.load(cpFile,0.0))()
+            assert learnChecked(planDir,expr,cp=cp)[2] == stack, leaveCnt
+            resumed.append(cp.reused)
+        assert max(resumed) > 0
+        results['checkpoint'] = resumed
+
+        # plan store built from compressed tar corpus learns the same expression
+        store = CorpusStore.fromPlans(corpusFile,expr,os.path.join(workDir,'store'))
+        assert learnChecked(None,expr,store)[2] == stack
+        # reopened store (occurence index already written)
+        assert learnChecked(None,expr,CorpusStore(store.storeDir))[2] == stack
+        results['store'] = store.planCount
+    finally:
+        shutil.rmtree(workDir)
+    return results
+
+def gitCommit():
+    '''Return current commit of the repository (None if git is not available).'''
+    try:
+        return subprocess.check_output(['git','rev-parse','--short','HEAD'],stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def compareResults(base,res):
+    '''Print table of times from base and res (results of the same suite, e.g. from two commits).'''
+    print('{:20} {:>12} {:>12} {:>8}'.format('',str(base.get('commit')),str(res.get('commit')),'ratio'))
+    for (name,r) in sorted(res['results'].items()):
+        b = base['results'].get(name)
+        if (not 'seconds' in r) or (b == None):
+            continue
+        print('{:20} {:12.6f} {:12.6f} {:8.3f}'.format(name,b['seconds'],r['seconds'],r['seconds'] / b['seconds']))
+
+SUITES = {'tokenizer':benchTokenizer,'corpus':benchCorpus,'learning':benchLearning,'sampling':benchSampling,'check':selfCheck}
+
+def main():
+    usage = "usage: %prog [options] SUITE\n\nSuites: {}".format(', '.join(sorted(SUITES)))
+    parser = OptionParser(usage=usage)
+
+    parser.add_option("-n", "--lines", dest="lines", type="int", default=200000,
+                      help="Number of plan lines used by tokenizer suite.")
+    parser.add_option("-k", "--repeat", dest="repeat", type="int", default=5,
+                      help="Repeat each measurement and report the best time.")
+    parser.add_option("-o", "--output", dest="outFile", metavar="OUT", default=None,
+                      help="Write JSON results to OUT instead of standard output.")
+    parser.add_option("-c", "--compare", dest="baseFile", metavar="BASE", default=None,
+                      help="Print comparison with JSON results from BASE (e.g. saved at another commit).")
+    parser.add_option("--plans", dest="plans", type="int", default=200,
+                      help="Number of generated plans used by corpus, learning and sampling suites.")
+    parser.add_option("--actions", dest="actions", type="int", default=5,
+                      help="Number of action types of generated plans.")
+    parser.add_option("--arity", dest="arity", type="int", default=3,
+                      help="Number of arguments of generated actions.")
+    parser.add_option("--length", dest="length", type="int", default=20,
+                      help="Length of generated plan structure (see plangen.py).")
+    parser.add_option("--body-repeat", dest="bodyRepeat", type="int", default=4,
+                      help="Maximal number of body repetitions in generated plans.")
+    parser.add_option("--objects", dest="objects", type="int", default=50,
+                      help="Size of the object pool of generated plans.")
+    parser.add_option("--seed", dest="seed", type="int", default=0,
+                      help="Random seed of plan generator.")
+    parser.add_option("--setup", dest="setup", type="int", default=0,
+                      help="Number of common setup actions of generated plans.")
+
+    parser.add_option("--sample-size", dest="sampleSize", type="int", default=50,
+                      help="Number of sampled plans used by sampling suite.")
+    parser.add_option("--sample-top", dest="sampleTop", type="int", action="append", default=None,
+                      help="Number of verified candidates used by sampling suite (can be repeated, default: 1 and 3).")
+
+    (options, args) = parser.parse_args()
+    if options.sampleTop == None:
+        options.sampleTop = [1,3]
+
+    if (len(args) != 1) or not (args[0] in SUITES):
+        parser.print_usage()
+        return
+
+    parameters = dict([(k,v) for (k,v) in vars(options).items() if not k in ('outFile','baseFile')])
+    res = {'suite':args[0],
+           'commit':gitCommit(),
+           'python':sys.version.split()[0],
+           'parameters':parameters,
+           'results':SUITES[args[0]](options)}
+
+    if options.outFile == None:
+        print(json.dumps(res,indent=1))
+    else:
+        with open(options.outFile,'w',encoding='utf-8') as outFile:
+            json.dump(res,outFile,indent=1)
+
+    if options.baseFile != None:
+        with open(options.baseFile,'r',encoding='utf-8') as baseFile:
+            compareResults(json.load(baseFile),res)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import time
+
+import events
+from retree import BRANCH_NAMES
+
+class LearningBudget(object):
+    '''Limits of one makeRE run (enable by refle.setBudget).
+       seconds .. wall time from creation of the budget
+       maxDepth .. nodes on level maxDepth are not split any more
+       maxNodes .. maximal number of split nodes (PlanRETree) in the tree
+       When a limit is reached, remaining subproblems are closed as trivial nodes (set of actions, see refle.initializePattern)
+       and recorded in truncated. The root is always split.'''
+
+    def __init__(self,seconds=None,maxDepth=None,maxNodes=None):
+        self.deadline = (time.perf_counter() + seconds) if seconds != None else None
+        self.maxDepth = maxDepth
+        self.maxNodes = maxNodes
+        self.nodes = 0
+        self.truncated = []
+
+    def exceeded(self,level):
+        '''Return reason why subproblem on given level cannot be split (None if it can).'''
+        if (self.maxDepth != None) and (level >= self.maxDepth):
+            return 'depth'
+        if (self.maxNodes != None) and (self.nodes >= self.maxNodes):
+            return 'nodes'
+        if (self.deadline != None) and (time.perf_counter() >= self.deadline):
+            return 'time'
+        return None
+
+    def addNode(self):
+        self.nodes += 1
+
+    def truncate(self,reason,level,trace,plans,actionSet):
+        '''Record subproblem closed as trivial node.'''
+        record = {'reason':reason,
+                  'level':level,
+                  'branch':BRANCH_NAMES.get(trace[2],'?'),
+                  'prevSplit':trace[3],
+                  'plans':len(plans),
+                  'actions':sorted(actionSet)}
+        self.truncated.append(record)
+        events.warning('truncated','{reason} budget: {branch} after {prevSplit} on level {level} closed with actions {actions}',**record)
+
+    def summary(self):
+        reasons = {}
+        for t in self.truncated:
+            reasons[t['reason']] = reasons.get(t['reason'],0) + 1
+        return {'nodes':self.nodes,'truncated':len(self.truncated),'reasons':reasons}
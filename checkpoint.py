@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import time
+
+import events
+from retree import BRANCH_NAMES, PlanRETree
+from pattern import Pattern
+
+# checkpoint file layout:
+# {"format": "dcklearn-checkpoint", "version": 1,
+#  "corpus": {"plans": n, "total": n, "digest": "..."},   learned corpus (see bindCorpus)
+#  "finished": {path: {"tree": ..., "pattern": ...}},      finished subtrees (see PlanRETree.succToDict, Pattern.toDict)
+#  "decisions": {path: action},                            split actions of unfinished nodes
+#  "pending": [{"path": p, "level": l, "trace": [...], "plans": n}, ...]}   unfinished nodes from the root down
+CHECKPOINT_FORMAT = 'dcklearn-checkpoint'
+CHECKPOINT_VERSION = 1
+
+def corpusDigest(nameLists,weights):
+    '''Fingerprint of the learned corpus - action names of each plan and its weight.'''
+    h = hashlib.sha1()
+    for (names,w) in zip(nameLists,weights):
+        h.update('{}:{}\n'.format(w,' '.join([str(a) for a in names])).encode('utf-8'))
+    return h.hexdigest()
+
+class LearningCheckpoint(object):
+    '''Periodically saved state of one makeRE run (enable by refle.setCheckpoint).
+       Node of the tree is identified by its path from the root - string of first letters of branch names h/m/t (see retree.BRANCH_NAMES), the root is ''.
+       Plans of a node are not stored - they are obtained again by replaying split decisions of its ancestors
+       on the same corpus, so resumed run only splits the plans without scoring candidate actions.
+       filename .. checkpoint file (replaced atomically)
+       interval .. minimal number of seconds between two saves'''
+
+    def __init__(self,filename,interval=60.0):
+        self.filename = filename
+        self.interval = interval
+        self.corpus = None
+        # path -> (successor,pattern) of finished subtrees, children of a finished node are dropped
+        self.finished = {}
+        # path -> split action of nodes which are not finished yet
+        self.decisions = {}
+        # unfinished nodes from the root down (path,level,trace,plan count)
+        self.pending = []
+        # number of subtrees taken from the checkpoint
+        self.reused = 0
+        self._lastSave = time.perf_counter()
+
+    @classmethod
+    def load(cls,filename,interval=60.0):
+        '''Continue from checkpoint saved by previous run.'''
+        with open(filename,'r',encoding='utf-8') as cpFile:
+            data = json.load(cpFile)
+
+        if data.get('format') != CHECKPOINT_FORMAT:
+            raise ValueError('{}: not a checkpoint file'.format(filename))
+        if data.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('{}: unsupported checkpoint version {}'.format(filename,data.get('version')))
+
+        res = cls(filename,interval)
+        res.corpus = data['corpus']
+        for (path,node) in data['finished'].items():
+            pattern = Pattern.fromDict(node['pattern']) if node['pattern'] != None else None
+            res.finished[path] = (PlanRETree.succFromDict(node['tree']),pattern)
+        res.decisions = dict(data['decisions'])
+        events.info('checkpoint','resuming from {filename}: {finished} finished subtrees, {decisions} split decisions',
+                    filename=filename,finished=len(res.finished),decisions=len(res.decisions))
+        return res
+
+    def bindCorpus(self,nameLists,weights):
+        '''Record learned corpus, resumed checkpoint must come from the same corpus.'''
+        corpus = {'plans':len(weights),'total':sum(weights),'digest':corpusDigest(nameLists,weights)}
+        if (self.corpus != None) and (self.corpus != corpus):
+            raise ValueError('{}: checkpoint was saved for different plans'.format(self.filename))
+        self.corpus = corpus
+
+    def enter(self,level,trace,plans):
+        '''Start node of makeRE, return its path.'''
+        if len(self.pending) > 0:
+            path = self.pending[-1]['path'] + BRANCH_NAMES[trace[2]][0]
+        else:
+            path = ''
+        self.pending.append({'path':path,'level':level,'trace':list(trace),'plans':len(plans)})
+        return path
+
+    def result(self,path):
+        '''Finished subtree (successor,pattern) of the node from previous run or None.'''
+        res = self.finished.get(path)
+        if res != None:
+            self.reused += 1
+        return res
+
+    def decision(self):
+        '''Split action of the current node recorded by previous run or None.'''
+        return self.decisions.get(self.pending[-1]['path'])
+
+    def decide(self,action):
+        self.decisions[self.pending[-1]['path']] = action
+        self.saveIfDue()
+
+    def leave(self,res):
+        '''Finish the current node with result (successor,pattern) of makeRE.'''
+        path = self.pending.pop()['path']
+        # finished node contains whole subtree
+        for p in [p for p in self.finished if p.startswith(path)]:
+            del self.finished[p]
+        for p in [p for p in self.decisions if p.startswith(path)]:
+            del self.decisions[p]
+        self.finished[path] = res
+        self.saveIfDue()
+
+    def saveIfDue(self):
+        if time.perf_counter() - self._lastSave >= self.interval:
+            self.save()
+
+    def toDict(self):
+        finished = {}
+        for (path,(succ,pattern)) in self.finished.items():
+            finished[path] = {'tree':PlanRETree.succToDict(succ),
+                              'pattern':pattern.toDict() if pattern != None else None}
+        return {'format':CHECKPOINT_FORMAT,
+                'version':CHECKPOINT_VERSION,
+                'corpus':self.corpus,
+                'finished':finished,
+                'decisions':dict(self.decisions),
+                'pending':list(self.pending)}
+
+    def save(self):
+        '''Write checkpoint - file is replaced only when the new one is complete.'''
+        tmpName = self.filename + '.tmp'
+        with open(tmpName,'w',encoding='utf-8') as cpFile:
+            json.dump(self.toDict(),cpFile,separators=(',',':'))
+        os.replace(tmpName,self.filename)
+        self._lastSave = time.perf_counter()
+        events.debug('checkpoint','checkpoint saved: {finished} finished subtrees, {pending} pending nodes',
+                     finished=len(self.finished),pending=len(self.pending))
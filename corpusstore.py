@@ -0,0 +1,275 @@
+import hashlib
+import json
+import mmap
+import os
+from array import array
+
+from planindex import PlanView
+from readplans import iterPlans
+
+# Disk-backed plan corpus. Store directory contains:
+# meta.json       {"format": "dcklearn-store", "version": 1, "actions": [names], "objects": [names],
+#                  "signature": {action: arity}, "plans": N}
+# plans.i64       offsets of plans in actions.i32 (N+1 items)
+# actions.i32     action IDs of all plans, -1 marks border action (None,None) at both ends of each plan
+# argoffsets.i64  offsets of action arguments in args.i32 (one item per action + 1)
+# args.i32        object IDs of action arguments
+# occoffsets.i64  offsets of positions of each action ID in occurrences.i64 (one item per action ID + border + 1)
+# occurrences.i64 global positions in actions.i32 grouped by action ID (border actions last), sorted within each group
+# Arrays are memory-mapped, plans are accessed through StoredPlan views referencing ranges of actions.
+# Occurence index is written once when the store is opened first time (stores without it are upgraded),
+# action positions in any view are then found by binary search in positions of the action.
+STORE_FORMAT = 'dcklearn-store'
+STORE_VERSION = 1
+BORDER_ID = -1
+
+# size of StoredPlan.key digest in bytes
+KEY_DIGEST_SIZE = 16
+
+# number of array items written at once while building the store
+FLUSH_ITEMS = 1 << 16
+
+def mapArray(path,typecode):
+    '''Memory-map binary file as read-only array of given typecode.'''
+    with open(path,'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return (None,memoryview(b'').cast(typecode))
+        mm = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    return (mm,memoryview(mm).cast(typecode))
+
+class ArrayWriter(object):
+    '''Append-only binary array file written in chunks.'''
+
+    def __init__(self,path,typecode):
+        self._file = open(path,'wb')
+        self._buf = array(typecode)
+        self._typecode = typecode
+        self.count = 0
+
+    def append(self,value):
+        self._buf.append(value)
+        self.count += 1
+        if len(self._buf) >= FLUSH_ITEMS:
+            self.flush()
+
+    def flush(self):
+        self._buf.tofile(self._file)
+        self._buf = array(self._typecode)
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+class CorpusStore(object):
+    '''Memory-mapped plan corpus (see module description).'''
+
+    def __init__(self,storeDir):
+        with open(os.path.join(storeDir,'meta.json'),'r',encoding='utf-8') as metaFile:
+            meta = json.load(metaFile)
+        if (meta.get('format') != STORE_FORMAT) or (meta.get('version') != STORE_VERSION):
+            raise ValueError('{}: not a plan store or unsupported version'.format(storeDir))
+
+        self.storeDir = storeDir
+        # border ID -1 indexes the last item - None
+        self.actionNames = meta['actions'] + [None]
+        self.actionIDs = dict([(a,i) for (i,a) in enumerate(meta['actions'])])
+        self.objectNames = meta['objects']
+        self.signature = meta['signature']
+        self.planCount = meta['plans']
+
+        self._maps = []
+        self.planOffsets = self.mapArray('plans.i64','q')
+        self.actions = self.mapArray('actions.i32','i')
+        self.argOffsets = self.mapArray('argoffsets.i64','q')
+        self.args = self.mapArray('args.i32','i')
+
+        if not os.path.exists(os.path.join(storeDir,'occurrences.i64')):
+            self.writeOccurrences()
+        self.occOffsets = self.mapArray('occoffsets.i64','q')
+        self.occurrences = self.mapArray('occurrences.i64','q')
+
+    def mapArray(self,fileName,typecode):
+        (mm,view) = mapArray(os.path.join(self.storeDir,fileName),typecode)
+        self._maps.append(mm)
+        return view
+
+    def writeOccurrences(self):
+        '''Write occurence index (counting sort of positions by action ID, output file is memory-mapped).'''
+        # border ID -1 is counted in the last slot
+        slots = len(self.actionIDs) + 1
+        counts = [0]*slots
+        for aID in self.actions:
+            counts[aID] += 1
+        offsets = array('q',[0])
+        for c in counts:
+            offsets.append(offsets[-1] + c)
+        with open(os.path.join(self.storeDir,'occoffsets.i64'),'wb') as f:
+            offsets.tofile(f)
+
+        total = len(self.actions)
+        with open(os.path.join(self.storeDir,'occurrences.i64'),'wb+') as f:
+            if total == 0:
+                return
+            f.truncate(total * 8)
+            mm = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_WRITE)
+            out = memoryview(mm).cast('q')
+            nextPos = list(offsets[:-1])
+            for (pos,aID) in enumerate(self.actions):
+                out[nextPos[aID]] = pos
+                nextPos[aID] += 1
+            out.release()
+            mm.close()
+
+    def occurrencesOf(self,action):
+        '''Return sorted global positions of action (None for border actions).'''
+        if action == None:
+            slot = len(self.actionIDs)
+        elif action in self.actionIDs:
+            slot = self.actionIDs[action]
+        else:
+            return self.occurrences[0:0]
+        return self.occurrences[self.occOffsets[slot]:self.occOffsets[slot+1]]
+
+    @staticmethod
+    def build(namedPlans,storeDir):
+        '''Write plans from iterable of pairs (planName,plan) to new store directory.
+           Plans are processed one by one - the corpus does not need to fit in memory.'''
+        os.makedirs(storeDir,exist_ok=True)
+
+        actionIDs = {}
+        objectIDs = {}
+        signature = {}
+
+        planOffsets = ArrayWriter(os.path.join(storeDir,'plans.i64'),'q')
+        actions = ArrayWriter(os.path.join(storeDir,'actions.i32'),'i')
+        argOffsets = ArrayWriter(os.path.join(storeDir,'argoffsets.i64'),'q')
+        args = ArrayWriter(os.path.join(storeDir,'args.i32'),'i')
+
+        planCnt = 0
+        for (name,plan) in namedPlans:
+            planOffsets.append(actions.count)
+            # border action at the beginning (see refle.wrapPlans)
+            actions.append(BORDER_ID)
+            argOffsets.append(args.count)
+            for (a,argTuple) in plan:
+                if not (a in actionIDs):
+                    actionIDs[a] = len(actionIDs)
+                    signature[a] = len(argTuple)
+                actions.append(actionIDs[a])
+                argOffsets.append(args.count)
+                for o in argTuple:
+                    if not (o in objectIDs):
+                        objectIDs[o] = len(objectIDs)
+                    args.append(objectIDs[o])
+            # border action at the end
+            actions.append(BORDER_ID)
+            argOffsets.append(args.count)
+            planCnt += 1
+
+        planOffsets.append(actions.count)
+        argOffsets.append(args.count)
+        for w in (planOffsets,actions,argOffsets,args):
+            w.close()
+
+        meta = {'format':STORE_FORMAT,
+                'version':STORE_VERSION,
+                'actions':sorted(actionIDs,key=actionIDs.get),
+                'objects':sorted(objectIDs,key=objectIDs.get),
+                'signature':signature,
+                'plans':planCnt}
+        with open(os.path.join(storeDir,'meta.json'),'w',encoding='utf-8') as metaFile:
+            json.dump(meta,metaFile)
+
+        return CorpusStore(storeDir)
+
+    @staticmethod
+    def fromPlans(dataRoot,exprList,storeDir,lower=False):
+        '''Build store from plan directory or corpus container.'''
+        return CorpusStore.build(iterPlans(dataRoot,exprList,lower),storeDir)
+
+    def plan(self,i):
+        '''Return view of i-th plan (border actions included).'''
+        return StoredPlan(self,self.planOffsets[i],self.planOffsets[i+1])
+
+    def plans(self,ids=None):
+        '''Return lazy sequence of plan views (all plans or plans with given IDs), views are created on access.'''
+        if ids == None:
+            ids = range(self.planCount)
+        return StoredPlans(self,ids)
+
+    def decode(self,pos):
+        '''Return action on global position pos as (actionName,argTuple), border action is (None,None).'''
+        aID = self.actions[pos]
+        if aID == BORDER_ID:
+            return (None,None)
+        objects = self.objectNames
+        argIDs = self.args[self.argOffsets[pos]:self.argOffsets[pos+1]]
+        return (self.actionNames[aID],tuple([objects[o] for o in argIDs]))
+
+class StoredPlans(object):
+    '''Sequence of stored plans given by plan IDs - only IDs are kept in memory.'''
+
+    def __init__(self,store,ids):
+        self.store = store
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return StoredPlans(self.store,self.ids[i])
+        return self.store.plan(self.ids[i])
+
+    def __iter__(self):
+        plan = self.store.plan
+        for i in self.ids:
+            yield plan(i)
+
+class StoredPlan(PlanView):
+    '''View of plan segment <start,end) in CorpusStore, positions are global positions in the store.'''
+
+    __slots__ = ('store',)
+
+    def __init__(self,store,start,end):
+        self.store = store
+        self.start = start
+        self.end = end
+
+    def decode(self,pos):
+        return self.store.decode(pos)
+
+    def view(self,start,end):
+        return StoredPlan(self.store,start,end)
+
+    def occurrences(self,action):
+        return self.store.occurrencesOf(action)
+
+    def names(self):
+        '''Return list of action names without decoding arguments.'''
+        names = self.store.actionNames
+        return [names[aID] for aID in self.store.actions[self.start:self.end]]
+
+    def argRange(self):
+        return (self.store.argOffsets[self.start],self.store.argOffsets[self.end])
+
+    def key(self):
+        '''Return digest of raw action IDs and argument IDs of the view - mapped ranges are hashed
+           without copying them to memory, views with the same key have to be compared by sameAs.'''
+        store = self.store
+        (argStart,argEnd) = self.argRange()
+        h = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+        h.update('{}:{}:'.format(self.end - self.start,argEnd - argStart).encode('ascii'))
+        h.update(store.actions[self.start:self.end])
+        h.update(store.args[argStart:argEnd])
+        return h.digest()
+
+    def sameAs(self,other):
+        '''Compare action IDs and argument IDs of two views of the same store.'''
+        store = self.store
+        assert other.store is store
+        (argStart,argEnd) = self.argRange()
+        (otherStart,otherEnd) = other.argRange()
+        return ((store.actions[self.start:self.end] == store.actions[other.start:other.end]) and
+                (store.args[argStart:argEnd] == store.args[otherStart:otherEnd]))
@@ -0,0 +1,106 @@
+import json
+import sys
+import time
+
+# Diagnostic events of the learner.
+# Event is a kind (e.g. 'split'), level, message template and named fields.
+# Nothing is formatted unless some sink accepts the level:
+#
+#   if events.enabled(events.DEBUG):
+#       events.emit(events.DEBUG,'split','lvl {level}: {action}',level=level,action=action)
+#
+# Sinks are configured once by the program (see configure), library code only emits events.
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVEL_NAMES = {DEBUG:'debug',INFO:'info',WARNING:'warning'}
+
+# progress events of one kind are emitted at most once per interval (seconds)
+PROGRESS_INTERVAL = 0.5
+
+class TextSink(object):
+    '''Write formatted messages to a text stream (standard output by default).'''
+
+    def __init__(self,stream=None):
+        self.stream = stream
+        self._progress = False
+
+    def out(self):
+        return self.stream if self.stream != None else sys.stdout
+
+    def write(self,level,kind,message,fields):
+        out = self.out()
+        if kind == 'progress':
+            # progress is rewritten on one line
+            out.write('\r' + message.format(**dict(fields,total='?' if fields['total'] == None else fields['total'])))
+            self._progress = not fields.get('finished',False)
+            if not self._progress:
+                out.write('\n')
+            out.flush()
+            return
+        if self._progress:
+            out.write('\n')
+            self._progress = False
+        out.write(message.format(**fields) + '\n')
+
+def jsonValue(value):
+    if isinstance(value,(set,frozenset)):
+        return sorted(value,key=str)
+    return str(value)
+
+class JSONSink(object):
+    '''Write one JSON object per event: {"time": t, "severity": name, "event": kind, field: value, ...}
+       Sets are written as sorted lists, other values which are not JSON types as strings.'''
+
+    def __init__(self,stream):
+        self.stream = stream
+
+    def write(self,level,kind,message,fields):
+        record = {'time':round(time.time(),6),'severity':LEVEL_NAMES.get(level,level),'event':kind}
+        record.update(fields)
+        self.stream.write(json.dumps(record,default=jsonValue) + '\n')
+        self.stream.flush()
+
+# list of pairs (minimal level,sink)
+sinks = [(INFO,TextSink())]
+# lowest level accepted by any sink - checked before any formatting
+minLevel = INFO
+# time of the last emitted progress event of each kind
+lastProgress = {}
+
+def configure(sinkList):
+    '''Replace sinks by list of pairs (minimal level,sink). Empty list disables all events.'''
+    global sinks, minLevel
+    sinks = list(sinkList)
+    minLevel = min([l for (l,s) in sinks]) if len(sinks) > 0 else WARNING + 1
+
+def enabled(level):
+    return level >= minLevel
+
+def emit(level,kind,message,/,**fields):
+    if level < minLevel:
+        return
+    for (sinkLevel,sink) in sinks:
+        if level >= sinkLevel:
+            sink.write(level,kind,message,fields)
+
+def debug(kind,message,/,**fields):
+    emit(DEBUG,kind,message,**fields)
+
+def info(kind,message,/,**fields):
+    emit(INFO,kind,message,**fields)
+
+def warning(kind,message,/,**fields):
+    emit(WARNING,kind,message,**fields)
+
+def progress(task,done,total=None):
+    '''Report progress of task (e.g. 'reading'). Events are rate-limited, the final one (done == total) is always emitted.'''
+    if INFO < minLevel:
+        return
+    finished = (total != None) and (done >= total)
+    now = time.perf_counter()
+    if (not finished) and (now - lastProgress.get(task,0.0) < PROGRESS_INTERVAL):
+        return
+    lastProgress[task] = now
+    emit(INFO,'progress','{task}: {done}/{total} plans',task=task,done=done,total=total,finished=finished)
@@ -0,0 +1,128 @@
+import importlib.util
+import os
+import sys
+
+# states with more outgoing transitions use dict lookup instead of if/elif chain
+DICT_DISPATCH_MIN = 5
+
+HEADER = '''# Generated by fsacodegen.py - specialized matcher of one learned FSA.
+# Do not edit - regenerate from the model instead.
+'''
+
+def groupMoves(transitions):
+    '''Return {dfaState:sorted list of (aName,destState)}'''
+    res = {}
+    for ((s,aName),d) in transitions.items():
+        res.setdefault(s,[]).append((aName,d))
+    for s in res:
+        res[s].sort()
+    return res
+
+def emitState(lines,indent,dfaState,movesByState):
+    '''Emit code advancing from one DFA state.'''
+    prefix = '    '*indent
+    moves = movesByState.get(dfaState,[])
+    if len(moves) == 0:
+        lines.append('{}return (False,i,STATES[{}])'.format(prefix,dfaState))
+    elif len(moves) < DICT_DISPATCH_MIN:
+        for (j,(aName,dest)) in enumerate(moves):
+            keyword = 'if' if j == 0 else 'elif'
+            lines.append('{}{} a == {!r}:'.format(prefix,keyword,aName))
+            lines.append('{}    state = {}'.format(prefix,dest))
+        lines.append('{}else:'.format(prefix))
+        lines.append('{}    return (False,i,STATES[{}])'.format(prefix,dfaState))
+    else:
+        lines.append('{}state = MOVES_{}.get(a,-1)'.format(prefix,dfaState))
+        lines.append('{}if state < 0:'.format(prefix))
+        lines.append('{}    return (False,i,STATES[{}])'.format(prefix,dfaState))
+
+def emitDispatch(lines,indent,low,high,movesByState):
+    '''Emit balanced if/else tree selecting code of DFA states in range <low,high).'''
+    if high - low == 1:
+        emitState(lines,indent,low,movesByState)
+        return
+
+    prefix = '    '*indent
+    mid = (low + high) // 2
+    lines.append('{}if state < {}:'.format(prefix,mid))
+    emitDispatch(lines,indent+1,low,mid,movesByState)
+    lines.append('{}else:'.format(prefix))
+    emitDispatch(lines,indent+1,mid,high,movesByState)
+
+def generateMatcher(fsa):
+    '''Return source of python module with function simulate(actionNames) specialized for given FSA.
+       The function returns the same triple as FSA.simulate.'''
+    (stateSets,transitions,accepting) = fsa.determinize()
+    movesByState = groupMoves(transitions)
+
+    lines = [HEADER]
+    lines.append('# DFA state -> sorted list of original FSA states')
+    lines.append('STATES = {!r}'.format([sorted(S) for S in stateSets]))
+    lines.append('ACCEPTING = frozenset({!r})'.format(sorted(accepting)))
+    lines.append('')
+
+    # dict constants for states with many transitions
+    for s in range(len(stateSets)):
+        moves = movesByState.get(s,[])
+        if len(moves) >= DICT_DISPATCH_MIN:
+            lines.append('MOVES_{} = {!r}'.format(s,dict(moves)))
+    lines.append('')
+
+    lines.append('def simulate(actionNames):')
+    lines.append('    state = 0')
+    lines.append('    for (i,a) in enumerate(actionNames):')
+    emitDispatch(lines,2,0,len(stateSets),movesByState)
+    lines.append('')
+    lines.append('    if state in ACCEPTING:')
+    lines.append('        return (True,None,STATES[state])')
+    lines.append('    else:')
+    lines.append('        return (False,len(actionNames),STATES[state])')
+    lines.append('')
+
+    return '\n'.join(lines)
+
+def matcherName(path):
+    return 'fsamatcher_{}'.format(os.path.splitext(os.path.basename(path))[0])
+
+def sourceStamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns,st.st_size)
+
+def dropBytecode(path):
+    '''Remove cached bytecode of the module - it is validated only by source mtime in seconds and size.'''
+    try:
+        os.remove(importlib.util.cache_from_source(path))
+    except OSError:
+        pass
+
+def writeMatcher(fsa,filename):
+    '''Generate matcher module for given FSA and save it to filename.
+       Previously loaded module and bytecode of the file are dropped.'''
+    path = os.path.abspath(filename)
+    with open(path,'w',encoding='utf-8') as modFile:
+        modFile.write(generateMatcher(fsa))
+    module = sys.modules.get(matcherName(path))
+    if (module != None) and (getattr(module,'__file__',None) == path):
+        del sys.modules[matcherName(path)]
+    dropBytecode(path)
+
+def loadMatcher(filename):
+    '''Import generated matcher module. The module is cached in sys.modules (and its bytecode in __pycache__)
+       and loaded again if the file changed.'''
+    path = os.path.abspath(filename)
+    modName = matcherName(path)
+    stamp = sourceStamp(path)
+    module = sys.modules.get(modName)
+    if (module != None) and (getattr(module,'__file__',None) == path):
+        if getattr(module,'_sourceStamp',None) == stamp:
+            return module
+        # the file was rewritten since the module was loaded
+        dropBytecode(path)
+
+    spec = importlib.util.spec_from_file_location(modName,path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module._sourceStamp = stamp
+    sys.modules[modName] = module
+
+    return module
@@ -0,0 +1,92 @@
+import numpy
+
+class TransitionTable(object):
+    '''Integer transition table of determinized FSA for vectorized simulation of many plans.
+
+       Rows are DFA states (see FSA.determinize), row `dead` is a sink state.
+       Columns are interned action IDs (see actionIDs), column `unknown` is used
+       for actions not in the FSA alphabet and column `pad` fills up short plans.
+
+       e.g. actionIDs = {'drive':0,'lift':1,'load':2}
+            unknown = 3, pad = 4
+    '''
+
+    def __init__(self,fsa,actionIDs=None):
+        (stateSets,transitions,accepting) = fsa.determinize()
+
+        if actionIDs == None:
+            actionIDs = dict([(a,i) for (i,a) in enumerate(sorted(set([a for (s,a) in transitions])))])
+
+        self.actionIDs = actionIDs
+        self.stateSets = stateSets
+        self.start = 0
+        self.dead = len(stateSets)
+        self.unknown = max(actionIDs.values(),default=-1) + 1
+        self.pad = self.unknown + 1
+
+        # sparse representation: coordinates and destinations of defined transitions
+        rows = []
+        cols = []
+        dests = []
+        for ((s,aName),d) in sorted(transitions.items()):
+            if aName in actionIDs:
+                rows.append(s)
+                cols.append(actionIDs[aName])
+                dests.append(d)
+        self.rows = numpy.array(rows,dtype=numpy.int32)
+        self.cols = numpy.array(cols,dtype=numpy.int32)
+        self.dests = numpy.array(dests,dtype=numpy.int32)
+
+        self.accepting = numpy.zeros(self.dead+1,dtype=bool)
+        self.accepting[sorted(accepting)] = True
+
+        self._dense = None
+
+    def dense(self):
+        '''Return dense table of shape (states+1,actions+2).
+           Undefined transitions lead to the dead state, pad column keeps the state.'''
+        if self._dense is None:
+            table = numpy.full((self.dead+1,self.pad+1),self.dead,dtype=numpy.int32)
+            table[self.rows,self.cols] = self.dests
+            table[:,self.pad] = numpy.arange(self.dead+1,dtype=numpy.int32)
+            self._dense = table
+
+        return self._dense
+
+    def sparse(self):
+        '''Return sparse table as coordinate triple (rows,cols,dests) of defined transitions only.'''
+        return (self.rows,self.cols,self.dests)
+
+    def encodePlans(self,plans):
+        '''Encode list of plans (lists of (actionName,args)) as integer matrix padded with pad column ID.
+           Returns pair (batch,lengths).'''
+        lengths = numpy.array([len(p) for p in plans],dtype=numpy.int32)
+        width = int(lengths.max()) if len(plans) > 0 else 0
+        batch = numpy.full((len(plans),width),self.pad,dtype=numpy.int32)
+        for (i,p) in enumerate(plans):
+            batch[i,:len(p)] = [self.actionIDs.get(a,self.unknown) for (a,args) in p]
+
+        return (batch,lengths)
+
+    def simulate(self,batch,lengths):
+        '''Advance all plans in the batch in lockstep - one table lookup per time step.
+           Returns triple of arrays (accepted,deviation,states) with the same meaning as FSA.simulate:
+           deviation is -1 for accepted plans, states holds DFA state IDs (dead for rejected plans).'''
+        table = self.dense()
+        planCnt = batch.shape[0]
+        states = numpy.full(planCnt,self.start,dtype=numpy.int32)
+        deviation = numpy.full(planCnt,-1,dtype=numpy.int32)
+
+        for t in range(batch.shape[1]):
+            states = table[states,batch[:,t]]
+            newDead = (states == self.dead) & (deviation < 0)
+            deviation[newDead] = t
+            if (states == self.dead).all():
+                break
+
+        accepted = self.accepting[states]
+        # plans read completely without reaching accepting state deviate at the end
+        unfinished = (~accepted) & (deviation < 0)
+        deviation[unfinished] = lengths[unfinished]
+
+        return (accepted,deviation,states)
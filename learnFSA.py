@@ -1,26 +1,104 @@
 #!/usr/bin/python3
 
+import os
 import re
 # option parsing
 from optparse import OptionParser
 from pathlib import Path
 
 import refle
+import events
 from FSA import *
+from model import saveModel
+from fsacodegen import writeMatcher
+from validate import validatePlans
+from corpusstore import CorpusStore
+from readplans import PlanFilter
+from profiler import MakeREProfiler
+from budget import LearningBudget
+from checkpoint import LearningCheckpoint
+from sampling import SplitSampling
+
+def configureEvents(options):
+    '''Set up text output according to -q/-v and JSON output to --events file.'''
+    if options.quiet:
+        textLevel = events.WARNING
+    elif options.verbose:
+        textLevel = events.DEBUG
+    else:
+        textLevel = events.INFO
+    sinkList = [(textLevel,events.TextSink())]
+    if options.eventsFile != None:
+        # file stays open till the end of the program
+        eventsOut = open(options.eventsFile,'w',encoding='utf-8')
+        sinkList.append((events.DEBUG if options.verbose else events.INFO,events.JSONSink(eventsOut)))
+    events.configure(sinkList)
 
 def main():
 #    usage = "usage: %prog -p PLANDIR [-r RE] [-o OUT -f FORMAT] [-m DOMAIN]"
-    usage = "usage: %prog -p PLANDIR [-r RE] [-o OUT -f FORMAT]"
+    usage = "usage: %prog -p PLANDIR [-r RE] [-R] [--include GLOB] [--exclude GLOB] [--store STOREDIR] [--index] [--trie] [--checkpoint CHECKPOINT [--resume]] [-o OUT -f FORMAT] [-s MODEL] [-g MATCHER]\n       %prog -c MODEL -p PLANDIR [-r RE] [-j JOBS] [-o OUT]"
     parser = OptionParser(usage=usage)
 
     parser.add_option("-p", "--path", dest="planDir", metavar="PLANDIR", default=None,
                       help="Path to directory with plans.")
     parser.add_option("-r", "--regexp", dest="filterStr", metavar="RE", default="..*",
                       help="Only plans with names matching given RE will be used for learning.")
+    parser.add_option("-R", "--recursive", dest="recursive", action="store_true", default=False,
+                      help="Search plans in nested subdirectories of PLANDIR.")
+    parser.add_option("--include", dest="include", metavar="GLOB", action="append", default=[],
+                      help="Only plans with relative path matching GLOB are used (can be repeated).")
+    parser.add_option("--exclude", dest="exclude", metavar="GLOB", action="append", default=[],
+                      help="Skip plans and subdirectories with relative path matching GLOB (can be repeated).")
     parser.add_option("-o", "--output", dest="outFileName", metavar="OUT", default=None,
                           help="Output filename base string.")
     parser.add_option("-f", "--format", dest="outFormat", metavar="FORMAT", default=None,
-                          help="Output file format (gv,png,svg,pdf)")
+                          help="Output file format (gv,png,svg,pdf) or comma separated list of formats (e.g. png,svg,pdf,gv).")
+    parser.add_option("-s", "--save", dest="saveModel", metavar="MODEL", default=None,
+                          help="Save learned model (FSA, tree and pattern) to MODEL file (JSON, gzip compressed if MODEL ends with .gz).")
+    parser.add_option("-g", "--generate", dest="matcherFile", metavar="MATCHER", default=None,
+                          help="Generate python module MATCHER (.py) with matcher specialized for learned FSA.")
+    parser.add_option("-c", "--check", dest="checkModel", metavar="MODEL", default=None,
+                          help="Check plans from PLANDIR against saved MODEL (or generated MATCHER) instead of learning. "
+                               "Results are written as JSON lines to OUT.jsonl (or stdout).")
+    parser.add_option("-j", "--jobs", dest="jobs", metavar="JOBS", type="int", default=None,
+                          help="Number of worker processes used for reading, checking or rendering (default: CPU count).")
+    parser.add_option("-l", "--lowercase", dest="lower", action="store_true", default=False,
+                          help="Lowercase action and object names when reading plans.")
+    parser.add_option("--index", dest="index", action="store_true", default=False,
+                          help="Index action positions of each plan - faster for long plans, slower for short ones (not used with --store).")
+    parser.add_option("--trie", dest="trie", action="store_true", default=False,
+                          help="Keep plans in prefix tree - shares presence filter and head blocks of plans with common prefixes, not faster in general (not used with --store).")
+    parser.add_option("--store", dest="storeDir", metavar="STOREDIR", default=None,
+                          help="Learn from memory-mapped plan store in STOREDIR. "
+                               "The store is built from PLANDIR first if it does not exist.")
+    parser.add_option("-q", "--quiet", dest="quiet", action="store_true", default=False,
+                          help="Print only warnings.")
+    parser.add_option("-v", "--verbose", dest="verbose", action="store_true", default=False,
+                          help="Print debug output of learning (split decisions, tree walk, pattern and stacks).")
+    parser.add_option("--events", dest="eventsFile", metavar="EVENTS", default=None,
+                          help="Write events as JSON lines to EVENTS file (debug events only with -v).")
+    parser.add_option("--time-limit", dest="timeLimit", metavar="SECONDS", type="float", default=None,
+                          help="Stop splitting after SECONDS (reading included) - remaining parts of plans are learned as sets of actions.")
+    parser.add_option("--max-depth", dest="maxDepth", metavar="DEPTH", type="int", default=None,
+                          help="Do not split nodes on level DEPTH and deeper.")
+    parser.add_option("--max-nodes", dest="maxNodes", metavar="NODES", type="int", default=None,
+                          help="Stop splitting when the tree has NODES split nodes.")
+    parser.add_option("--sample", dest="sampleSize", metavar="SIZE", type="int", default=None,
+                          help="Score split candidates of nodes with more than SIZE plans on a random sample of SIZE plans (approximate learning).")
+    parser.add_option("--sample-top", dest="sampleTop", metavar="K", type="int", default=3,
+                          help="Number of best candidates from the sample verified on all plans (--sample, default: %default).")
+    parser.add_option("--sample-seed", dest="sampleSeed", metavar="SEED", type="int", default=0,
+                          help="Random seed of plan samples (--sample, default: %default).")
+    parser.add_option("--profile", dest="profileFile", metavar="PROFILE", default=None,
+                          help="Record time spent in each node of the learned tree. PROFILE is JSON (.json) or folded stacks for flame graph tools (other names).")
+    parser.add_option("--profile-memory", dest="profileMemory", action="store_true", default=False,
+                          help="Record also memory allocated in each node (--profile, slower).")
+    parser.add_option("--checkpoint", dest="checkpointFile", metavar="CHECKPOINT", default=None,
+                          help="Periodically save finished parts of the learned tree to CHECKPOINT file.")
+    parser.add_option("--checkpoint-interval", dest="checkpointInterval", metavar="SECONDS", type="float", default=60.0,
+                          help="Minimal time between two checkpoint saves (default: %default).")
+    parser.add_option("--resume", dest="resume", action="store_true", default=False,
+                          help="Continue learning from CHECKPOINT saved by interrupted run (learning starts from scratch if it does not exist).")
 #    parser.add_option("-m", "--mergePDDL", dest="pddlDomain", metavar="DOMAIN", default=None,
 #                      help="Path to PDDL domain file.")
 
@@ -30,17 +108,89 @@ def main():
     filterStr = options.filterStr
     outFileName = options.outFileName
     outFormat = options.outFormat
+    modelFile = options.saveModel
 #    pddlDomain = options.pddlDomain
 
-    if planDir == None:
-        print('Missing path to plans (option -p)')
+    configureEvents(options)
+
+    if (options.checkModel != None) and (planDir == None):
+        # plans are checked from PLANDIR only (plan store is not used for validation)
+        parser.error('option -c needs plans to check (option -p)')
+
+    storeDir = options.storeDir
+    storeExists = (storeDir != None) and os.path.exists(os.path.join(storeDir,'meta.json'))
+
+    if (planDir == None) and not storeExists:
+        events.warning('usage','Missing path to plans (option -p)')
+        return
+
+    expr=PlanFilter(re.compile(filterStr),options.include,options.exclude,options.recursive)
+
+    if options.checkModel != None:
+        # validation mode - no learning
+        if outFileName == None:
+            validatePlans(options.checkModel,planDir,expr,options.jobs,lower=options.lower)
+        else:
+            with open("{}.jsonl".format(outFileName),"w",encoding="utf-8") as resFile:
+                validatePlans(options.checkModel,planDir,expr,options.jobs,resFile,options.lower)
+        return
+
+    store = None
+    if storeDir != None:
+        if storeExists:
+            store = CorpusStore(storeDir)
+        else:
+            store = CorpusStore.fromPlans(planDir,expr,storeDir,options.lower)
+
+    if options.profileFile != None:
+        prof = MakeREProfiler(options.profileMemory)
+        refle.setProfiler(prof)
+
+    limits = (options.timeLimit,options.maxDepth,options.maxNodes)
+    if limits != (None,None,None):
+        refle.setBudget(LearningBudget(*limits))
+
+    if options.sampleSize != None:
+        refle.setSampling(SplitSampling(options.sampleSize,options.sampleTop,options.sampleSeed))
+
+    if options.checkpointFile != None:
+        if options.resume and os.path.exists(options.checkpointFile):
+            refle.setCheckpoint(LearningCheckpoint.load(options.checkpointFile,options.checkpointInterval))
+        else:
+            refle.setCheckpoint(LearningCheckpoint(options.checkpointFile,options.checkpointInterval))
+    elif options.resume:
+        events.warning('usage','Option --resume needs checkpoint file (option --checkpoint)')
         return
 
-    expr=re.compile(filterStr)
+    if options.index and (store != None):
+        events.warning('usage','Option --index is ignored for plan store')
+    if options.trie and (store != None):
+        events.warning('usage','Option --trie is ignored for plan store')
+
+    (reTree,pattern,stack) = refle.learnDomain(planDir,expr,options.jobs,store,options.lower,options.trie,options.index)
+
+    if options.profileFile != None:
+        refle.setProfiler(None)
+        prof.save(options.profileFile)
 
-    stack = refle.processDomain(planDir,expr)
+    if refle.budget != None:
+        summary = refle.budget.summary()
+        events.info('budget','{truncated} subproblems truncated ({reasons}), {nodes} split nodes',**summary)
+        refle.setBudget(None)
+
+    if refle.checkpoint != None:
+        events.info('checkpoint','{reused} subtrees reused from checkpoint {filename}',
+                    reused=refle.checkpoint.reused,filename=refle.checkpoint.filename)
+        refle.setCheckpoint(None)
 
     A = FSA.initFromStack(stack)
+    events.info('fsa','FSA: {states} states, {transitions} transitions',states=len(A.states),transitions=len(A.transitions))
+
+    if modelFile != None:
+        saveModel(modelFile,A,reTree,pattern)
+
+    if options.matcherFile != None:
+        writeMatcher(A,options.matcherFile)
 
     # do we render diagram?
     diagram = True
@@ -49,29 +199,35 @@ def main():
 #    pddlOut = True
 
     if outFileName == None:
-        print('Output file not specified. Use -o "NAME"')
+        events.warning('usage','Output file not specified. Use -o "NAME"')
         diagram = False
         pddlOut = False
 
     if outFormat == None:
         diagram = False
+        outFormats = []
+    else:
+        # comma separated list of formats without duplicates
+        outFormats = []
+        for f in outFormat.split(','):
+            if (len(f) > 0) and not (f in outFormats):
+                outFormats.append(f)
 
     imageFormats = set(['png','svg','pdf'])
 
-    if (not (outFormat in imageFormats)) and (outFormat != 'gv'):
-        print('File format not specified or unknown.')
+    if (len(outFormats) == 0) or any([(not (f in imageFormats)) and (f != 'gv') for f in outFormats]):
+        events.warning('usage','File format not specified or unknown.')
         diagram = False
 
     if diagram:
-        # render image
-        if outFormat in imageFormats:
-             A.render(outFileName,outFormat)
-        else:
+        if outFormats == ['gv']:
             # save graphviz textual representation
-            if outFormat == 'gv':
-                A.saveDiagram("{}.{}".format(outFileName,outFormat))
+            A.saveDiagram("{}.{}".format(outFileName,'gv'))
+        else:
+            # render images (and gv) concurrently from one dot source
+            A.renderFormats(outFileName,outFormats,options.jobs)
     else:
-        print("Option -f missing - FSA diagram not rendered.")
+        events.warning('usage',"Option -f missing - FSA diagram not rendered.")
 
 #    if pddlDomain == None:
 #        print('No domain specified. Use -m "PATH_TO_DOMAIN_FILE"')
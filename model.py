@@ -0,0 +1,59 @@
+import gzip
+import json
+
+from FSA import FSA
+from retree import PlanRETree
+from pattern import Pattern
+
+# saved model layout:
+# {"format": "dcklearn-model", "version": 1,
+#  "fsa": {...},        see FSA.toDict
+#  "tree": {...},       optional - see PlanRETree.toDict
+#  "pattern": {...}}    optional - see Pattern.toDict
+MODEL_FORMAT = 'dcklearn-model'
+MODEL_VERSION = 1
+
+def openModelFile(filename,mode):
+    '''Models with .gz suffix are gzip compressed.'''
+    if filename.endswith('.gz'):
+        return gzip.open(filename,mode + 't',encoding='utf-8')
+    else:
+        return open(filename,mode,encoding='utf-8')
+
+def saveModel(filename,fsa,reTree=None,pattern=None):
+    '''Save learned FSA (and optionally PlanRETree and Pattern) so it can be used without relearning.'''
+    data = {'format':MODEL_FORMAT,
+            'version':MODEL_VERSION,
+            'fsa':fsa.toDict()}
+    if reTree != None:
+        data['tree'] = reTree.toDict()
+    if pattern != None:
+        data['pattern'] = pattern.toDict()
+
+    with openModelFile(filename,'w') as modelFile:
+        json.dump(data,modelFile,separators=(',',':'))
+
+def loadModelData(filename):
+    '''Read saved model and check its format and version.'''
+    with openModelFile(filename,'r') as modelFile:
+        data = json.load(modelFile)
+
+    if data.get('format') != MODEL_FORMAT:
+        raise ValueError('{}: not a model file'.format(filename))
+    if data.get('version') != MODEL_VERSION:
+        raise ValueError('{}: unsupported model version {}'.format(filename,data.get('version')))
+
+    return data
+
+def loadFullModel(filename):
+    '''Load triple (FSA,PlanRETree,Pattern) saved by saveModel. Missing parts are None.'''
+    data = loadModelData(filename)
+    fsa = FSA.fromDict(data['fsa'])
+    reTree = PlanRETree.fromDict(data['tree']) if 'tree' in data else None
+    pattern = Pattern.fromDict(data['pattern']) if 'pattern' in data else None
+
+    return (fsa,reTree,pattern)
+
+def loadModel(filename):
+    '''Load FSA saved by saveModel.'''
+    return FSA.fromDict(loadModelData(filename)['fsa'])
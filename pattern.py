@@ -1,6 +1,10 @@
+import hashlib
 from itertools import zip_longest
 from collections import defaultdict
 
+# size of Pattern.structureKey digest in bytes
+STRUCTURE_DIGEST_SIZE = 16
+
 def partition(elements, equiv):
     '''Find sets of elements that are equivalent according to equiv function.'''
     partitions = [] # Found partitions
@@ -69,6 +73,9 @@ def getComponents(inList):
 
 def getActionIndexList(action,plan):
     '''Get list of action occurence indices. Empty list means no such action is present in the plan.'''
+    if hasattr(plan,'indicesOf'):
+        # IndexedPlan or StoredPlan (see refle.getActionIndexList)
+        return plan.indicesOf(action)
     aoList = []
     for (i,(a,args)) in enumerate(plan):
         if a == action:
@@ -181,7 +188,7 @@ class Pattern(object):
         # - all actions between first and last action became one empty action
         # - if there is no action between first and last it will become one empty action
 
-        compressedPlans = list(map(lambda p:compressPlan(p,trace),plans))
+        compressedPlans = (compressPlan(p,trace) for p in plans)
 
         #firstLen = len(compressedPlans[0])
         #if firstLen <= 3:
@@ -234,6 +241,18 @@ class Pattern(object):
 
         return argMap
 
+    def toDict(self):
+        '''Return JSON compatible description of the pattern (see model.py).'''
+        return {'sequence':list(self.pSequence),
+                'equivalenceSets':[sorted([list(pos) for pos in S]) for S in self.pEqSetList],
+                'signature':self.dSignature}
+
+    @classmethod
+    def fromDict(cls,data):
+        '''Initialize pattern from description produced by toDict.'''
+        eqSetList = [set([tuple(pos) for pos in S]) for S in data['equivalenceSets']]
+        return cls(list(data['sequence']),eqSetList,data['signature'])
+
     @property
     def equivalenceSets(self):
         return self.pEqSetList
@@ -254,9 +273,13 @@ class Pattern(object):
     @staticmethod
     def plans2patt(plans):
         ''' Process plans into sequence and list of equivalence sets.
-            plans .. list of input plans
+            plans .. iterable of input plans (only plans with distinct structure are kept)
         '''
 
+        # plans differing only in object names give the same equivalence sets
+        # - refine the pattern once per group (first plan of each group is kept)
+        plans = Pattern.distinctStructures(plans)
+
         # initialize action sequence and object positions with the first plan
         (actSeq,maskList) = Pattern.getEqClasses(plans[0])
 
@@ -320,6 +343,47 @@ class Pattern(object):
 
         return (pSequence,pEqSetList)
 
+    @staticmethod
+    def canonicalPlan(plan):
+        '''Rename objects to numbers in order of their first appearance.
+           e.g. [('lift', ('h1', 'c1')), ('load', ('h1', 't1'))] -> (('lift', (0, 1)), ('load', (0, 2)))
+           Plans with identical canonical form differ only by consistent renaming of objects.'''
+        objectIDs = {}
+        res = []
+        for (a,args) in plan:
+            if args == None:
+                res.append((a,None))
+                continue
+            ids = []
+            for o in args:
+                i = objectIDs.get(o)
+                if i == None:
+                    i = objectIDs[o] = len(objectIDs)
+                ids.append(i)
+            res.append((a,tuple(ids)))
+        return tuple(res)
+
+    @staticmethod
+    def structureKey(plan):
+        '''Digest of canonical form of the plan, plans with the same key are compared by canonicalPlan.'''
+        return hashlib.blake2b(repr(Pattern.canonicalPlan(plan)).encode('utf-8'),digest_size=STRUCTURE_DIGEST_SIZE).digest()
+
+    @staticmethod
+    def distinctStructures(plans):
+        '''Return first plan of each group of plans with identical canonical form (in original order).'''
+        # key -> indices of kept plans with the key (more than one only for colliding digests)
+        seen = {}
+        res = []
+        for p in plans:
+            candidates = seen.setdefault(Pattern.structureKey(p),[])
+            if len(candidates) > 0:
+                canonical = Pattern.canonicalPlan(p)
+                if len([i for i in candidates if Pattern.canonicalPlan(res[i]) == canonical]) > 0:
+                    continue
+            candidates.append(len(res))
+            res.append(p)
+        return res
+
     @staticmethod
     def getObjectPositions(obj,plan):
             '''Get list of positions for given object in given plan.
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+import os
+import random
+# option parsing
+from optparse import OptionParser
+
+from readplans import writeCorpus, planName, openPlanFile
+
+# Synthetic plans with known repetition structure:
+#   setup.head.(body)^k.tail    with k from <1,repeat> chosen for each plan
+# head, body and tail are fixed sequences of action types shared by all plans,
+# only the number of body repetitions and the objects differ between plans.
+# Actions of one block (head, one body repetition, tail) share their first argument
+# (e.g. the same truck in all actions of one delivery),
+# other arguments are drawn from the object pool.
+# Optional setup is the same sequence of actions (objects included) at the beginning of all plans.
+
+class PlanGenerator(object):
+    '''Generator of synthetic plans (see module description).'''
+
+    def __init__(self,actions=5,arity=3,length=20,repeat=4,objects=50,seed=0,setup=0):
+        '''actions .. number of action types
+           arity .. number of arguments of each action
+           length .. number of actions in head, body and tail together
+           repeat .. maximal number of body repetitions
+           objects .. size of the object pool
+           setup .. number of common actions at the beginning of all plans
+        '''
+        assert (actions > 0) and (length >= 3) and (repeat > 0) and (objects > 0) and (setup >= 0)
+        self.rnd = random.Random(seed)
+        self.arity = arity
+        self.repeat = repeat
+        self.actionNames = ['a{}'.format(i) for i in range(actions)]
+        self.objectNames = ['o{}'.format(i) for i in range(objects)]
+
+        # head and tail take one quarter of the length each
+        edgeLen = max(1,length // 4)
+        bodyLen = max(1,length - 2*edgeLen)
+        self.head = [self.rnd.choice(self.actionNames) for i in range(edgeLen)]
+        self.body = [self.rnd.choice(self.actionNames) for i in range(bodyLen)]
+        self.tail = [self.rnd.choice(self.actionNames) for i in range(edgeLen)]
+        # setup actions are generated once with their arguments
+        self.setup = [(self.rnd.choice(self.actionNames),tuple([self.rnd.choice(self.objectNames) for j in range(arity)]))
+                      for i in range(setup)]
+
+    def blocks(self,repeatCnt):
+        return [self.head] + [self.body]*repeatCnt + [self.tail]
+
+    def plan(self,repeatCnt=None):
+        '''Generate one plan as list of actions (actionName,argTuple).'''
+        if repeatCnt == None:
+            repeatCnt = self.rnd.randint(1,self.repeat)
+        plan = list(self.setup)
+        for block in self.blocks(repeatCnt):
+            # actions of one block share their first argument
+            shared = self.rnd.choice(self.objectNames)
+            for a in block:
+                if self.arity == 0:
+                    plan.append((a,tuple()))
+                else:
+                    args = [shared] + [self.rnd.choice(self.objectNames) for j in range(self.arity - 1)]
+                    plan.append((a,tuple(args)))
+        return plan
+
+    def plans(self,planCnt,repeatCnt=None):
+        return [self.plan(repeatCnt) for i in range(planCnt)]
+
+def generatePlans(planCnt,actions=5,arity=3,length=20,repeat=4,objects=50,seed=0,setup=0):
+    '''Return list of planCnt synthetic plans (see PlanGenerator).'''
+    return PlanGenerator(actions,arity,length,repeat,objects,seed,setup).plans(planCnt)
+
+def writePlanDir(plans,planDir,compressEvery=0):
+    '''Write plans to directory - one file per plan in the format read by readplans.py.
+       With compressEvery set every compressEvery-th plan is gzip compressed (plan01.txt.gz).'''
+    os.makedirs(planDir,exist_ok=True)
+    width = len(str(max(0,len(plans) - 1)))
+    for (i,plan) in enumerate(plans):
+        fileName = 'plan{:0{}}.txt'.format(i,width)
+        if (compressEvery > 0) and ((i % compressEvery) == 0):
+            fileName += '.gz'
+        with openPlanFile(os.path.join(planDir,fileName),'w') as pfile:
+            for (a,args) in plan:
+                pfile.write('({})\n'.format(' '.join((a,) + args)))
+
+def main():
+    usage = "usage: %prog -o OUT [options]\n\nGenerate synthetic plans to directory OUT (or corpus file if OUT ends with .jsonl or .tar)."
+    parser = OptionParser(usage=usage)
+
+    parser.add_option("-o", "--output", dest="out", metavar="OUT", default=None,
+                      help="Output plan directory or corpus file.")
+    parser.add_option("-n", "--plans", dest="plans", type="int", default=100,
+                      help="Number of plans.")
+    parser.add_option("-a", "--actions", dest="actions", type="int", default=5,
+                      help="Number of action types.")
+    parser.add_option("-k", "--arity", dest="arity", type="int", default=3,
+                      help="Number of arguments of each action.")
+    parser.add_option("-L", "--length", dest="length", type="int", default=20,
+                      help="Length of plan structure (head, body and tail together).")
+    parser.add_option("-R", "--repeat", dest="repeat", type="int", default=4,
+                      help="Maximal number of body repetitions.")
+    parser.add_option("-O", "--objects", dest="objects", type="int", default=50,
+                      help="Size of the object pool.")
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=0,
+                      help="Random seed.")
+    parser.add_option("-S", "--setup", dest="setup", type="int", default=0,
+                      help="Number of common setup actions at the beginning of all plans.")
+
+    (options, args) = parser.parse_args()
+
+    if options.out == None:
+        parser.print_usage()
+        return
+
+    plans = generatePlans(options.plans,options.actions,options.arity,options.length,
+                          options.repeat,options.objects,options.seed,options.setup)
+    if os.path.splitext(planName(options.out))[1] in ('.jsonl','.tar'):
+        writeCorpus([('plan{}'.format(i),p) for (i,p) in enumerate(plans)],options.out)
+    else:
+        writePlanDir(plans,options.out)
+    print('{} plans written to {}'.format(len(plans),options.out))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from bisect import bisect_left
+
+# In-memory plans with action occurence index.
+# Index of each plan (action name -> sorted positions) is built once when plans are loaded (see refle.learnDomain).
+# Sub-plans produced by splits are IndexedPlan views of ranges of the original plan sharing its index,
+# so action positions in a sub-plan on any level are found by binary search instead of rescanning the sub-plan.
+
+class PlanIndex(object):
+    '''Actions of one plan with positions of each action name.'''
+
+    __slots__ = ('actions','names','positions')
+
+    def __init__(self,plan):
+        self.actions = list(plan)
+        self.names = [a for (a,args) in self.actions]
+        self.positions = {}
+        for (i,a) in enumerate(self.names):
+            if a in self.positions:
+                self.positions[a].append(i)
+            else:
+                self.positions[a] = [i]
+
+class PlanView(object):
+    '''Read-only view of segment <start,end) of action sequence with occurence index.
+       Behaves like list of actions (actionName,argTuple) - slicing returns another view without copying.
+       Subclasses provide sequence of the view:
+         decode(pos)         action on position pos of the sequence
+         view(start,end)     view of another segment of the same sequence
+         occurrences(action) sorted positions of action in the sequence'''
+
+    __slots__ = ('start','end')
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self,key):
+        if key.__class__ is slice:
+            (i,j,step) = key.indices(self.end - self.start)
+            assert step == 1
+            return self.view(self.start + i,self.start + max(i,j))
+        if key < 0:
+            key += self.end - self.start
+        if (key < 0) or (key >= self.end - self.start):
+            raise IndexError('plan index out of range')
+        return self.decode(self.start + key)
+
+    def __iter__(self):
+        for pos in range(self.start,self.end):
+            yield self.decode(pos)
+
+    def segment(self,action):
+        '''Return (positions,lo,hi) - positions[lo:hi] are positions of action inside the view.'''
+        positions = self.occurrences(action)
+        lo = bisect_left(positions,self.start)
+        hi = bisect_left(positions,self.end,lo)
+        return (positions,lo,hi)
+
+    def indicesOf(self,action):
+        '''Return list of indices of action occurences (binary search in the occurence index).'''
+        (positions,lo,hi) = self.segment(action)
+        start = self.start
+        if start == 0:
+            return list(positions[lo:hi])
+        return [p - start for p in positions[lo:hi]]
+
+    def countOf(self,action):
+        (positions,lo,hi) = self.segment(action)
+        return hi - lo
+
+    def __repr__(self):
+        return str(list(self))
+
+# positions of actions missing in a plan
+NO_POSITIONS = ()
+
+class IndexedPlan(PlanView):
+    '''View of plan segment with shared PlanIndex.'''
+
+    __slots__ = ('index',)
+
+    def __init__(self,index,start=0,end=None):
+        self.index = index
+        self.start = start
+        self.end = end if end != None else len(index.actions)
+
+    def decode(self,pos):
+        return self.index.actions[pos]
+
+    def view(self,start,end):
+        return IndexedPlan(self.index,start,end)
+
+    def occurrences(self,action):
+        return self.index.positions.get(action,NO_POSITIONS)
+
+    def __iter__(self):
+        return iter(self.index.actions[self.start:self.end])
+
+    def names(self):
+        '''Return list of action names.'''
+        return self.index.names[self.start:self.end]
+
+    def key(self):
+        '''Return hashable content of the view.'''
+        return tuple(self.index.actions[self.start:self.end])
+
+def indexPlans(plans):
+    '''Return IndexedPlan views of whole plans (lists of actions).'''
+    return [IndexedPlan(PlanIndex(p)) for p in plans]
@@ -0,0 +1,197 @@
+from bisect import bisect_left
+
+from planindex import IndexedPlan
+
+# Prefix tree of plans for corpora where plans share long common prefixes (e.g. the same setup actions).
+# The trie is built once when plans are loaded (see refle.learnDomain). Whole plans and all head blocks
+# split from them (head of head of ...) are prefixes of the original plans - TriePlan views ending in a trie node.
+# Split statistics of such subproblems are computed over the part of the trie spanned by their paths,
+# so shared prefixes are processed once, and head blocks ending in the same trie node are extracted
+# only once. Middle and tail blocks are ordinary IndexedPlan views.
+# Block lengths of candidate actions and middle and tail splits are computed per plan (see refle.SplitFeatures),
+# they dominate learning time, so the trie does not make learning faster (README.md, --trie is opt-in).
+#
+# The trie is path-compressed: edge of a node is range <start,end) of actions of one plan going through it
+# (PlanIndex shared with IndexedPlan views), so long unbranched parts are one node. Nodes are split
+# when some plan or head block ends inside an edge.
+
+class TrieNode(object):
+    '''Node of PlanTrie - path from the root to the node is prefix <0,end) of plans going through it.'''
+
+    __slots__ = ('index','start','end','parent','children')
+
+    def __init__(self,index,start,end,parent):
+        # PlanIndex of one of the plans going through the node, edge is index.actions[start:end]
+        self.index = index
+        self.start = start
+        self.end = end
+        self.parent = parent
+        # first action of child edge -> child
+        self.children = {}
+
+    def prefix(self):
+        '''TriePlan view of the path from the root to the node.'''
+        return TriePlan(self.index,0,self.end,self)
+
+class TriePlan(IndexedPlan):
+    '''IndexedPlan view of plan prefix ending in trie node (see module description).'''
+
+    __slots__ = ('node',)
+
+    def __init__(self,index,start,end,node):
+        IndexedPlan.__init__(self,index,start,end)
+        self.node = node
+
+def commonLength(a,b,start,end):
+    '''Length of common part of a[start:end] and b[start:end] (slices are compared by binary search).'''
+    end = min(end,len(b))
+    if a[start:end] == b[start:end]:
+        return end - start
+    (lo,hi) = (0,end - start)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[start:start + mid] == b[start:start + mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def splitEdge(node,length):
+    '''Return node ending at length of the path (edge of node is split if length is inside it).'''
+    if length == node.end:
+        return node
+    assert node.start < length < node.end
+    mid = TrieNode(node.index,node.start,length,node.parent)
+    node.parent.children[node.index.actions[node.start]] = mid
+    node.start = length
+    node.parent = mid
+    mid.children[node.index.actions[length]] = node
+    return mid
+
+class PlanTrie(object):
+    '''Path-compressed prefix tree of actions (actionName,argTuple) of plans.'''
+
+    def __init__(self):
+        self.root = TrieNode(None,0,0,None)
+
+    def add(self,plan):
+        '''Insert whole plan (IndexedPlan) and return its TriePlan view.'''
+        index = plan.index
+        actions = index.actions
+        node = self.root
+        pos = 0
+        while pos < len(actions):
+            child = node.children.get(actions[pos])
+            if child == None:
+                child = TrieNode(index,pos,len(actions),node)
+                node.children[actions[pos]] = child
+            else:
+                child = splitEdge(child,pos + commonLength(child.index.actions,actions,pos,child.end))
+            node = child
+            pos = node.end
+        return TriePlan(index,0,len(actions),node)
+
+def triePlans(plans):
+    '''Return TriePlan views of indexed plans (see planindex.indexPlans) inserted to one new PlanTrie.'''
+    trie = PlanTrie()
+    return [trie.add(p) for p in plans]
+
+def spannedTrie(plans):
+    '''Part of the trie spanned by paths to the nodes of plans (TriePlan list).
+       Return pair (preorder list of nodes starting with the trie root,children of each node) - each node is visited once.'''
+    children = {}
+    root = None
+    for p in plans:
+        # walk up until the path joins the part registered already
+        (node,child) = (p.node,None)
+        while node != None:
+            known = node in children
+            if not known:
+                children[node] = []
+            if child != None:
+                children[node].append(child)
+            if known:
+                break
+            (node,child) = (node.parent,node)
+        if node == None:
+            root = child
+    preorder = []
+    stack = [root] if root != None else []
+    while len(stack) > 0:
+        node = stack.pop()
+        preorder.append(node)
+        stack.extend(children[node])
+    return (preorder,children)
+
+def triePresence(plans):
+    '''Number of plans containing each action name without their first and last action (see refle.trimPlan).
+       Plans are TriePlan views of whole plans or head blocks (all of them start in the trie root).'''
+    (preorder,children) = spannedTrie(plans)
+    # number of plans ending in each node and in each subtree
+    ends = dict([(node,0) for node in preorder])
+    for p in plans:
+        ends[p.node] += 1
+    below = dict(ends)
+    for node in reversed(preorder):
+        for c in children[node]:
+            below[node] += below[c]
+
+    presence = {}
+    # action names on the current path
+    seen = set()
+    stack = [(preorder[0],None)] if len(preorder) > 0 else []
+    while len(stack) > 0:
+        (node,added) = stack.pop()
+        if added != None:
+            # leaving the node
+            seen.difference_update(added)
+            continue
+        # the first action of plans is not counted
+        start = max(node.start,1)
+        if start < node.end:
+            names = node.index.names
+            inner = set(names[start:node.end - 1]) - seen
+            for name in inner:
+                presence[name] = presence.get(name,0) + below[node]
+            last = names[node.end - 1]
+            added = inner
+            if not ((last in seen) or (last in inner)) and (below[node] > ends[node]):
+                # plans ending in the node do not contain their last action in the trimmed part
+                presence[last] = presence.get(last,0) + below[node] - ends[node]
+                added = inner | set([last])
+            seen.update(added)
+            stack.append((node,added))
+        stack.extend([(c,None) for c in children[node]])
+    return presence
+
+def trieHeadBlocks(action,plans):
+    '''Head blocks of split by action (see refle.processPlan) - prefixes ending in the first occurence of action
+       (after the first action of plan) or whole plans without action. Blocks ending in the same node are returned once,
+       in the order of the first plan they come from.'''
+    (preorder,children) = spannedTrie(plans)
+    # head node of each node - the first occurence of action on its path (None if not found yet)
+    headOf = {}
+    for node in preorder:
+        parentHead = headOf.get(node.parent)
+        if parentHead != None:
+            headOf[node] = parentHead
+            continue
+        headOf[node] = None
+        # the first action of plans is not searched
+        start = max(node.start,1)
+        if start < node.end:
+            positions = node.index.positions.get(action,[])
+            i = bisect_left(positions,start)
+            if (i < len(positions)) and (positions[i] < node.end):
+                # head block ends inside the edge (or at its end)
+                headOf[node] = splitEdge(node,positions[i] + 1)
+    heads = set()
+    order = []
+    for p in plans:
+        head = headOf[p.node]
+        if head == None:
+            head = p.node
+        if not (head in heads):
+            heads.add(head)
+            order.append(head)
+    return [h.prefix() for h in order]
@@ -0,0 +1,123 @@
+import json
+import time
+import tracemalloc
+
+from retree import BRANCH_NAMES
+
+# time of one node is divided into phases (see refle.splitNode):
+# split     .. action set, presence index and sampling of candidate actions
+# select    .. selector.selectActionStaged (with block lengths of candidates alive in its stages)
+# partition .. split of plans by the selected action
+# pattern   .. initializePattern in leaves, connectPatterns in inner nodes
+PHASES = ('split','select','partition','pattern')
+
+class NodeProfile(object):
+    '''Measured values of one makeRE call.'''
+
+    def __init__(self,name,level,recursionType,plans,actions):
+        self.name = name
+        self.level = level
+        self.recursionType = recursionType
+        self.plans = plans
+        self.actions = actions
+        self.candidates = 0
+        self.action = None
+        self.times = dict([(p,0.0) for p in PHASES])
+        self.seconds = 0.0
+        self.netBytes = None
+        self.children = []
+        # measurement state
+        self._start = None
+        self._last = None
+        self._mem = None
+
+    def selfSeconds(self):
+        return self.seconds - sum([c.seconds for c in self.children])
+
+    def toDict(self):
+        res = {'name':self.name,
+               'level':self.level,
+               'recursionType':self.recursionType,
+               'plans':self.plans,
+               'actions':self.actions,
+               'candidates':self.candidates,
+               'action':self.action,
+               'seconds':self.seconds,
+               'selfSeconds':self.selfSeconds(),
+               'phases':dict(self.times),
+               'children':[c.toDict() for c in self.children]}
+        if self.netBytes != None:
+            res['netBytes'] = self.netBytes
+        return res
+
+class MakeREProfiler(object):
+    '''Collects NodeProfile for each makeRE call (enable by refle.setProfiler).
+       memory .. trace allocations with tracemalloc (net bytes allocated by each subtree, slows learning down)'''
+
+    def __init__(self,memory=False):
+        self.memory = memory
+        self.roots = []
+        self._stack = []
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def enter(self,level,trace,plans):
+        name = BRANCH_NAMES.get(trace[2],'?') if level > 0 else 'root'
+        node = NodeProfile(name,level,trace[2],len(plans),sum([len(p) for p in plans]))
+        if self.memory:
+            node._mem = tracemalloc.get_traced_memory()[0]
+        if len(self._stack) > 0:
+            self._stack[-1].children.append(node)
+        else:
+            self.roots.append(node)
+        self._stack.append(node)
+        # plan counting is not part of any phase
+        node._start = node._last = time.perf_counter()
+        return node
+
+    def mark(self,phase):
+        '''Add time since the previous mark to phase of the current node.'''
+        node = self._stack[-1]
+        now = time.perf_counter()
+        node.times[phase] += now - node._last
+        node._last = now
+
+    def leave(self,action,candidates):
+        node = self._stack.pop()
+        now = time.perf_counter()
+        node.seconds = now - node._start
+        node.action = action
+        node.candidates = candidates
+        if self.memory:
+            node.netBytes = tracemalloc.get_traced_memory()[0] - node._mem
+        if len(self._stack) > 0:
+            # time of the parent node was stopped while the child was running
+            self._stack[-1]._last = time.perf_counter()
+
+    def toDict(self):
+        return {'nodes':[r.toDict() for r in self.roots]}
+
+    def writeJSON(self,out):
+        json.dump(self.toDict(),out,indent=1)
+
+    def writeFolded(self,out):
+        '''Write folded stacks (input of flamegraph.pl, speedscope, ...) - one line per node phase in microseconds.'''
+        for r in self.roots:
+            self.foldNode(r,[],out)
+
+    def foldNode(self,node,path,out):
+        frames = path + ['{}:{}'.format(node.name,node.action if node.action != None else '-')]
+        for p in PHASES:
+            us = int(round(node.times[p] * 1e6))
+            if us > 0:
+                out.write('{};{} {}\n'.format(';'.join(frames),p,us))
+        for c in node.children:
+            self.foldNode(c,frames,out)
+
+    def save(self,filename):
+        '''Save profile as JSON (filename ends with .json) or folded stacks (other names).'''
+        with open(filename,'w',encoding='utf-8') as out:
+            if filename.endswith('.json'):
+                self.writeJSON(out)
+            else:
+                self.writeFolded(out)
@@ -1,34 +1,324 @@
 import sys
 import os
 import re
+import posixpath
+import io
+import json
+import tarfile
+import gzip
+import bz2
+import lzma
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from functools import partial
+from optparse import OptionParser
 
-def filterFiles(fileList,expr):
-    '''Filter only files matching given expression.'''
-    for f in fileList:
-        if expr.match(f):
-            yield f
+import events
 
-def getPlansWithArgs(dataRoot,exprList):
-    '''Return list of all plans found in the dataRoot filtered by expr'''
+# smaller plan sets are read without starting worker processes
+PARALLEL_MIN_FILES = 64
 
-    files = [f for f in os.listdir(dataRoot) if (os.path.isfile(os.path.join(dataRoot, f)))]
-    plans = []
-    for f in filterFiles(files,exprList):
-        print('reading: {}'.format(f))
-        with open(os.path.join(dataRoot,f),'r') as pfile:
-            plan = []
-            for line in pfile:
-                strLine = line.strip('()\n')
-                # TODO: use regexp to filter out empty or commented lines
-                if len(strLine) == 0:
-                    continue
-                tokens = strLine.split(' ')
-                if len(tokens) > 1:
-                    action = tuple([tokens[0],tuple(tokens[1:])])
+# compressed plan files and containers are decoded on the fly
+COMPRESSED_OPEN = {'.gz':gzip.open,'.bz2':bz2.open,'.xz':lzma.open}
+
+# number of distinct plain lines whose actions are reused within one plan (see parsePlanLines)
+LINE_CACHE_SIZE = 4096
+
+def openPlanFile(path,mode='r'):
+    '''Open plan file or corpus in text mode, (de)compress according to its suffix.'''
+    openFunction = COMPRESSED_OPEN.get(os.path.splitext(path)[1])
+    if openFunction == None:
+        return open(path,mode,encoding='utf-8')
+    else:
+        return openFunction(path,mode + 't',encoding='utf-8')
+
+def planName(fileName):
+    '''Plan name is file name without compression suffix (plan01.txt.gz -> plan01.txt)'''
+    (base,ext) = os.path.splitext(fileName)
+    if ext in COMPRESSED_OPEN:
+        return base
+    else:
+        return fileName
+
+class PlanFilter(object):
+    '''Selection of plans by name.
+       expr (compiled regular expression) is matched against the plan name without directories,
+       include/exclude globs are matched against the whole relative path (e.g. "2024-05-*/plan*.txt").
+       Compression suffix is ignored in both cases (plan01.txt.gz is matched as plan01.txt).
+       Directories matching an exclude glob are not entered at all.'''
+
+    def __init__(self,expr,include=None,exclude=None,recursive=False):
+        self.expr = expr
+        self.include = include or []
+        self.exclude = exclude or []
+        self.recursive = recursive
+
+    def match(self,relPath):
+        '''Check plan given by path relative to plan directory (or member name in corpus container).'''
+        name = planName(relPath)
+        if not self.expr.match(posixpath.basename(name)):
+            return False
+        if (len(self.include) > 0) and not any([fnmatchcase(name,g) for g in self.include]):
+            return False
+        return not any([fnmatchcase(name,g) for g in self.exclude])
+
+    def matchDir(self,relDir):
+        return not any([fnmatchcase(relDir,g) for g in self.exclude])
+
+def asPlanFilter(exprList):
+    '''Plain regular expression selects plans in the top directory only.'''
+    if isinstance(exprList,PlanFilter):
+        return exprList
+    return PlanFilter(exprList)
+
+def scanPlanDir(dirPath,relDir,planFilter):
+    # entry type comes from the directory listing - no extra stat call per file on most systems
+    # entries are sorted per directory, subdirectories are scanned lazily when reached
+    with os.scandir(dirPath) as it:
+        entries = sorted(it,key=lambda e: e.name)
+    for entry in entries:
+        relPath = relDir + entry.name
+        if entry.is_file():
+            if planFilter.match(relPath):
+                yield relPath
+        elif planFilter.recursive and entry.is_dir() and planFilter.matchDir(relPath):
+            yield from scanPlanDir(entry.path,relPath + '/',planFilter)
+
+def iterPlanFiles(dataRoot,exprList):
+    '''Generate paths of plan files relative to dataRoot ("/" separated) selected by exprList
+       (compiled regular expression or PlanFilter). Files are sorted by name within each directory.'''
+    return scanPlanDir(dataRoot,'',asPlanFilter(exprList))
+
+def getPlanFiles(dataRoot,exprList):
+    '''Return list of plan file names in the dataRoot filtered by expr (see iterPlanFiles)'''
+    return list(iterPlanFiles(dataRoot,exprList))
+
+class InternTable(dict):
+    '''Token -> interned (and lowercased if lower is set) token, filled on first lookup.'''
+
+    def __init__(self,lower=False):
+        dict.__init__(self)
+        self.lower = lower
+
+    def __missing__(self,token):
+        res = sys.intern(token.lower() if self.lower else token)
+        self[token] = res
+        return res
+
+def parsePlanLines(lines,lower=False):
+    '''Parse lines of one plan and return list of actions (actionName,argTuple)
+       Accepted line formats:
+         (drive t1 p0 p1)
+         drive t1 p0 p1
+         0.000: (drive t1 p0 p1) [1.000]     timestamp and duration are ignored
+         ; cost = 12                         comments (also at the end of line)
+       Tokens are separated by any whitespace, names are interned (and lowercased if lower is set).'''
+    plan = []
+    append = plan.append
+    # each distinct token is interned once
+    token = InternTable(lower).__getitem__
+    # action of plain lines seen in this plan (repeated lines share one action), at most LINE_CACHE_SIZE lines
+    actions = {}
+    known = actions.get
+    # one pass per line - the loop is inlined as it runs over millions of lines
+    for line in lines:
+        plain = line[:1] == '('
+        if plain:
+            action = known(line)
+            if action is not None:
+                append(action)
+                continue
+        text = line
+        if ';' in text:
+            text = text[:text.index(';')]
+        if '(' in text:
+            # timestamp before "(" and duration after ")" are cut off without scanning the tokens
+            text = text.partition('(')[2].partition(')')[0]
+        tokens = text.split()
+        if not tokens:
+            continue
+        (name,*args) = map(token,tokens)
+        action = (name,tuple(args))
+        if plain and (len(actions) < LINE_CACHE_SIZE):
+            actions[line] = action
+        append(action)
+
+    return plan
+
+def tokenizeLine(line,lower=False):
+    '''Return action (actionName,argTuple) from one plan line or None for empty and comment lines.'''
+    actions = parsePlanLines((line,),lower)
+    return actions[0] if actions else None
+
+def readPlan(path,lower=False):
+    '''Read one (possibly compressed) plan file and return list of actions (actionName,argTuple)'''
+    with openPlanFile(path) as pfile:
+        return parsePlanLines(pfile,lower)
+
+########## corpus containers ########
+# Corpus is one file holding many named plans:
+# - JSON Lines (.jsonl) - one plan per line: {"name": "plan01", "plan": [["lift", ["h1", "c1"]], ...]}
+# - tar archive - plan files in the usual text format, member name is the plan name
+# Plan name filter (-r) is applied to base name of each plan like to file names in plan directory.
+# Containers and plans in tar archive may be compressed (.gz, .bz2, .xz).
+
+def isCorpus(dataRoot):
+    '''Corpus container is a file, plan directory is a directory.'''
+    return os.path.isfile(dataRoot)
+
+def iterJsonCorpus(corpusFile,planFilter,lower=False):
+    intern = sys.intern
+    with openPlanFile(corpusFile) as cfile:
+        for line in cfile:
+            if len(line.strip()) == 0:
+                continue
+            record = json.loads(line)
+            name = record['name']
+            if planFilter.match(name):
+                if lower:
+                    plan = [(intern(a.lower()),tuple([intern(o.lower()) for o in args])) for (a,args) in record['plan']]
                 else:
-                    action = tuple([tokens[0],tuple()])
-                plan.append(action)
+                    plan = [(intern(a),tuple([intern(o) for o in args])) for (a,args) in record['plan']]
+                yield (name,plan)
+
+def iterTarCorpus(corpusFile,planFilter,lower=False):
+    with tarfile.open(corpusFile,'r:*') as tfile:
+        # members are read in archive order - no seeking back in the stream
+        for member in tfile:
+            if not member.isfile():
+                continue
+            if not planFilter.match(member.name):
+                continue
+            content = tfile.extractfile(member)
+            ext = os.path.splitext(member.name)[1]
+            if ext in COMPRESSED_OPEN:
+                # compressed plan file inside the archive
+                text = COMPRESSED_OPEN[ext](content,'rt',encoding='utf-8')
+            else:
+                text = io.TextIOWrapper(content,encoding='utf-8')
+            yield (planName(member.name),parsePlanLines(text,lower))
+
+def iterCorpus(corpusFile,exprList,lower=False):
+    '''Generate pairs (planName,plan) from corpus container in the order they are stored.'''
+    if tarfile.is_tarfile(corpusFile):
+        return iterTarCorpus(corpusFile,asPlanFilter(exprList),lower)
+    else:
+        return iterJsonCorpus(corpusFile,asPlanFilter(exprList),lower)
+
+def writeCorpus(namedPlans,corpusFile):
+    '''Write pairs (planName,plan) to corpus container.
+       Tar archive is written if corpusFile ends with .tar (or .tar.gz, .tar.bz2, .tar.xz), JSON Lines otherwise.
+       Compression is chosen according to the suffix.'''
+    cnt = 0
+    (base,ext) = os.path.splitext(corpusFile)
+    if corpusFile.endswith('.tar') or (base.endswith('.tar') and (ext in COMPRESSED_OPEN)):
+        tarMode = 'w' if ext == '.tar' else 'w:{}'.format(ext[1:])
+        with tarfile.open(corpusFile,tarMode) as tfile:
+            for (name,plan) in namedPlans:
+                lines = ['({})\n'.format(' '.join((a,) + tuple(args))) for (a,args) in plan]
+                data = ''.join(lines).encode('utf-8')
+                # plans are written as plain text - compression suffix is dropped from the name
+                info = tarfile.TarInfo(planName(name))
+                info.size = len(data)
+                tfile.addfile(info,io.BytesIO(data))
+                cnt += 1
+    else:
+        with openPlanFile(corpusFile,'w') as cfile:
+            for (name,plan) in namedPlans:
+                record = {'name':name,'plan':[[a,list(args)] for (a,args) in plan]}
+                cfile.write(json.dumps(record,separators=(',',':')))
+                cfile.write('\n')
+                cnt += 1
+
+    return cnt
 
+def iterPlans(dataRoot,exprList,lower=False):
+    '''Generate pairs (planName,plan) one by one from plan directory (sorted by file name) or corpus container.
+       Plan names are without compression suffix (see planName).'''
+    if isCorpus(dataRoot):
+        for namedPlan in iterCorpus(dataRoot,exprList,lower):
+            yield namedPlan
+    else:
+        for f in iterPlanFiles(dataRoot,exprList):
+            yield (planName(f),readPlan(os.path.join(dataRoot,f),lower))
+
+def convertPlanDir(dataRoot,exprList,corpusFile,lower=False):
+    '''Convert directory with one file per plan to corpus container (plans sorted by file name).'''
+    return writeCorpus(iterPlans(dataRoot,exprList,lower),corpusFile)
+
+def readPlanChunk(paths,lower=False):
+    '''Read list of plan files (one shard for worker process)'''
+    return [readPlan(p,lower) for p in paths]
+
+def getPlansWithArgs(dataRoot,exprList,jobs=None,lower=False):
+    '''Return list of all plans found in the dataRoot filtered by expr.
+       Plans are sorted by file name and read in parallel by jobs worker processes (CPU count by default).
+       If dataRoot is a corpus container the plans are read sequentially in stored order.
+       Action and object names are lowercased if lower is set.'''
+
+    if isCorpus(dataRoot):
+        plans = []
+        for (name,plan) in iterCorpus(dataRoot,exprList,lower):
             plans.append(plan)
+            events.progress('reading',len(plans))
+        events.progress('reading',len(plans),len(plans))
+        return plans
+
+    files = getPlanFiles(dataRoot,exprList)
+    paths = [os.path.join(dataRoot,f) for f in files]
+    total = len(paths)
+
+    if jobs == None:
+        jobs = os.cpu_count() or 1
+
+    plans = []
+    if (jobs < 2) or (total < PARALLEL_MIN_FILES):
+        for p in paths:
+            plans.append(readPlan(p,lower))
+            events.progress('reading',len(plans),total)
+    else:
+        # several shards per worker keep all workers busy till the end
+        chunkSize = max(1,min(1000,total // (jobs*8)))
+        chunks = [paths[i:i+chunkSize] for i in range(0,total,chunkSize)]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            # map returns results in order of chunks - plans stay sorted by file name
+            for chunkPlans in pool.map(partial(readPlanChunk,lower=lower),chunks):
+                plans.extend(chunkPlans)
+                events.progress('reading',len(plans),total)
+
+    if total == 0:
+        events.progress('reading',0,0)
 
     return plans
+
+def main():
+    usage = "usage: %prog -p PLANDIR [-r RE] [-R] [--include GLOB] [--exclude GLOB] -o CORPUS\n\nConvert plan directory to one corpus file (JSON Lines, or tar archive if CORPUS ends with .tar).\nCORPUS is compressed if it ends with .gz, .bz2 or .xz."
+    parser = OptionParser(usage=usage)
+
+    parser.add_option("-p", "--path", dest="planDir", metavar="PLANDIR", default=None,
+                      help="Path to directory with plans.")
+    parser.add_option("-r", "--regexp", dest="filterStr", metavar="RE", default="..*",
+                      help="Only plans with names matching given RE will be converted.")
+    parser.add_option("-R", "--recursive", dest="recursive", action="store_true", default=False,
+                      help="Search plans in nested subdirectories of PLANDIR.")
+    parser.add_option("--include", dest="include", metavar="GLOB", action="append", default=[],
+                      help="Only plans with relative path matching GLOB are converted (can be repeated).")
+    parser.add_option("--exclude", dest="exclude", metavar="GLOB", action="append", default=[],
+                      help="Skip plans and subdirectories with relative path matching GLOB (can be repeated).")
+    parser.add_option("-o", "--output", dest="corpusFile", metavar="CORPUS", default=None,
+                      help="Output corpus file.")
+    parser.add_option("-l", "--lowercase", dest="lower", action="store_true", default=False,
+                      help="Lowercase action and object names.")
+
+    (options, args) = parser.parse_args()
+
+    if (options.planDir == None) or (options.corpusFile == None):
+        parser.print_usage()
+        return
+
+    planFilter = PlanFilter(re.compile(options.filterStr),options.include,options.exclude,options.recursive)
+    cnt = convertPlanDir(options.planDir,planFilter,options.corpusFile,options.lower)
+    print('{} plans written to {}'.format(cnt,options.corpusFile))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import re
+
+# code characters are taken from unicode private use area
+CODE_BASE = 0xE000
+# character used for actions not present in the expression
+UNKNOWN_CODE = '\x00'
+
+def actionNames(stack):
+    '''Generate action names from the stack (plain names, (name,args) tuples and sets).'''
+    for item in stack:
+        if isinstance(item,tuple):
+            yield item[0]
+        elif isinstance(item,set):
+            for elem in item:
+                yield elem
+        elif isinstance(item,str) and not (item in ('(',')','*','+') or item.isdigit()):
+            yield item
+
+def quantify(atom,quantifier):
+    '''Append quantifier to the atom = (text,unit), wrap the text in a group if it is not a single unit.'''
+    (text,unit) = atom
+    if unit:
+        return (text + quantifier,False)
+    else:
+        return ('(?:{}){}'.format(text,quantifier),False)
+
+class PlanRegex(object):
+    '''Regular expression over action names compiled to python re.
+
+       Each action name is mapped to one code character. Symbols from PlanRETree stack
+       (see FSA.initFromStack) are translated:
+       action            -> its code character
+       set of actions    -> character class repeated zero or more times
+       '(' ... ')'       -> non-capturing group
+       '*','+'           -> quantifier of previous action or group
+       '0'               -> nothing (no middle section)
+       '1'               -> previous action is present twice (see FSA.copyGroup), nothing after group
+
+       e.g. stack: ['lift', 'load', 'drive', '(', {'load', 'unload'}, 'drive', ')', '*']
+            pattern: abc(?:[bd]*c)*   (with a,b,c,d standing for code characters)
+
+       The expression accepts the same training plans as FSA.simulate, but the two can disagree on unseen plans
+       because of the way FSA.repeatGroup builds '*' and '+':
+       - repetition is a lambda transition back to the state before the group and an action set following the group
+         loops on the state after it, so the FSA lets them interleave ('drive' '*' {'load'}: drive load drive
+         is accepted by the FSA, rejected by the expression)
+       - skip of '*' group is a copy of the transition entering the state before the group, so actions of a set
+         looping on that state cannot precede the skipped group ({'load'} 'drive' '*' 'drop': load drop is rejected
+         by the FSA, accepted by the expression)
+    '''
+
+    def __init__(self,stack,codes=None):
+        if codes == None:
+            names = sorted(set(actionNames(stack)))
+            codes = dict([(a,chr(CODE_BASE+i)) for (i,a) in enumerate(names)])
+
+        self.codes = codes
+        self.pattern = self.stack2pattern(stack)
+        self.regex = re.compile(self.pattern)
+
+    @classmethod
+    def fromTree(cls,reTree,codes=None):
+        '''Initialize expression from PlanRETree.'''
+        return cls(reTree.__repr__(),codes)
+
+    def stack2pattern(self,stack):
+        # stack of atom lists - one list for each open parenthesis
+        # atom is pair (text,unit) - unit is True if quantifier can be appended directly
+        groups = [[]]
+        prev = None
+        for item in stack:
+            if isinstance(item,set):
+                chars = ''.join(sorted(re.escape(self.codes[a]) for a in item))
+                groups[-1].append(('[{}]*'.format(chars),False))
+            elif isinstance(item,tuple):
+                groups[-1].append((re.escape(self.codes[item[0]]),True))
+            elif item == '(':
+                groups.append([])
+            elif item == ')':
+                inner = ''.join([text for (text,unit) in groups.pop()])
+                groups[-1].append(('(?:{})'.format(inner),True))
+            elif item == '*' or item == '+':
+                groups[-1][-1] = quantify(groups[-1][-1],item)
+            elif item.isdigit():
+                if (item == '1') and (prev != ')'):
+                    # "action 1" stands for the action repeated twice
+                    groups[-1].append(groups[-1][-1])
+            else:
+                groups[-1].append((re.escape(self.codes[item]),True))
+            prev = item
+
+        assert len(groups) == 1
+        return ''.join([text for (text,unit) in groups[0]])
+
+    def encode(self,plan):
+        '''Encode plan (list of (actionName,args) or list of names) as string of code characters.'''
+        return ''.join([self.codes.get(a if isinstance(a,str) else a[0],UNKNOWN_CODE) for a in plan])
+
+    def match(self,plan):
+        '''Check if the whole plan matches the expression.'''
+        return self.regex.fullmatch(self.encode(plan)) != None
+
+    def __repr__(self):
+        '''Print expression with code characters replaced by action names.'''
+        names = dict([(c,a) for (a,c) in self.codes.items()])
+        return ''.join([' {} '.format(names[ch]) if ch in names else ch for ch in self.pattern])
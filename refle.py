@@ -1,23 +1,68 @@
 # refactored learning.py
+import io
 import re
 import operator
+from array import array
 # own modules
 from readplans import *
+import events
 #from multichains import *
 from pattern import *
-from selector import selectAction
+from selector import selectActionStaged, rankActions
 from retree import PlanRETree
+from planindex import indexPlans
+from plantrie import triePlans, triePresence, trieHeadBlocks
 
-def countAction(action,plan):
-    cnt = 0
-    for (aName,args) in plan:
-        if action == aName:
-            cnt += 1
+# MakeREProfiler collecting per node measurements of makeRE (None - profiling is off)
+profiler = None
+
+def setProfiler(p):
+    '''Enable profiling of makeRE by profiler.MakeREProfiler (None disables it).'''
+    global profiler
+    profiler = p
+
+# LearningBudget limiting the tree (None - no limits)
+budget = None
+
+def setBudget(b):
+    '''Limit makeRE by budget.LearningBudget (None removes the limits).'''
+    global budget
+    budget = b
+
+# SplitSampling scoring candidate actions on samples of plans (None - all plans are used)
+sampling = None
+
+def setSampling(s):
+    '''Select split actions approximately by sampling.SplitSampling (None restores exact selection).'''
+    global sampling
+    sampling = s
 
-    return cnt
+# LearningCheckpoint saving finished subtrees (None - no checkpoints)
+checkpoint = None
+
+def setCheckpoint(c):
+    '''Save state of makeRE to checkpoint.LearningCheckpoint and reuse its finished subtrees (None disables it).'''
+    global checkpoint
+    checkpoint = c
+
+def planActionNames(plan):
+    '''Return list of action names in the plan.
+       Plans from CorpusStore (StoredPlan) are read without decoding arguments.'''
+    if hasattr(plan,'names'):
+        return plan.names()
+    return [a for (a,args) in plan]
+
+def countAction(action,plan):
+    if hasattr(plan,'countOf'):
+        return plan.countOf(action)
+    return len(getActionIndexList(action,plan))
 
 def getActionIndexList(action,plan):
     '''Get list of action occurence indices. Empty list means no such action is present in the plan.'''
+    if hasattr(plan,'indicesOf'):
+        # IndexedPlan or StoredPlan - binary search in occurence index of the whole plan
+        return plan.indicesOf(action)
+
     aoList = []
     for (i,(a,args)) in enumerate(plan):
         if a == action:
@@ -46,16 +91,16 @@ def splitPlan(action,planIn):
          [('load', ('hhh1', 'ccc1', 'ttt1', 'p3'))]]
     '''
 
-    plan = list(planIn)
-    aoStack = getActionIndexList(action,plan)
-    if len(aoStack) == 0:
+    # plan is only sliced - lists are copied, IndexedPlan and StoredPlan views are not
+    plan = planIn
+    aoList = getActionIndexList(action,plan)
+    if len(aoList) == 0:
         # the action was not found in the plan
         return None
 
     start = 0
     blockList = []
-    while len(aoStack) > 0:
-        end = aoStack.pop(0)
+    for end in aoList:
         # end index marks action occurence.
         # blocks are cut including start and excluding end index: <start,end>
         blockList.append(plan[start:end+1])
@@ -68,16 +113,14 @@ def splitPlan(action,planIn):
 
 def trimPlan(plan,start=True,end=True):
     '''Cut first and last action from input plan.
-       Return copy of the original plan.
+       Return copy of the original plan (or new view of StoredPlan).
     '''
-    res = list(plan)
-
     if start and end:
-        return res[1:-1]
+        return plan[1:-1]
     elif start and (not end):
-        return res[1:]
+        return plan[1:]
     elif (not start) and end:
-        return res[:-1]
+        return plan[:-1]
     else:
         # this is equivalent to not calling trimPlan at all
         return plan
@@ -132,21 +175,54 @@ def processPlan(action,plan,headList,middleList,tailList):
 
     return actionCnt
 
+def splitData(action,trimmedPlans):
+    '''Split all plans by action and return data used for scoring (see selector.selectAction):
+       (minAcnt,maxAcnt,totalCnt,head,middle,tail)'''
+    # initialization of internal loop variables
+    # P.a.(R.a)*.Q
+    headList = []
+    middleList = []
+    tailList = []
+
+    # count max and min number of occurences across all plans
+    # initialize counters
+    maxAcnt = 0
+    minAcnt = max([len(p) for p in trimmedPlans])
+
+    # we need total action count to disambiguate scoring
+    totalCnt = 0
+    # splitting each plan into three parts and cummulating head, middle and tail block lists
+    for plan in trimmedPlans:
+
+        actionCnt = processPlan(action,plan,headList,middleList,tailList)
+
+        totalCnt = totalCnt + actionCnt
+
+        if actionCnt > maxAcnt:
+            maxAcnt = actionCnt
+
+        if actionCnt < minAcnt:
+            minAcnt = actionCnt
+
+    return (minAcnt,maxAcnt,totalCnt,headList,middleList,tailList)
+
 def identicActionSeq(plans):
     '''Check if all action sequences are identical in given set of plans'''
-    firstSeq = [a for (a,_) in plans[0]]
+    planIter = iter(plans)
+    firstSeq = planActionNames(next(planIter))
 
-    for p in plans[1:]:
-        seq = [a for (a,_) in p]
+    for p in planIter:
+        seq = planActionNames(p)
         if firstSeq != seq:
             return False
 
     return True
 
-def initializePattern(actionSet,plans,domainSignature,trace,level):
-    '''Initialize pattern when there is no available action that could be used to split plans further'''
-    print('No action selected at level {}'.format(level))
-    print('returning: {}'.format(actionSet))
+def initializePattern(actionSet,plans,domainSignature,trace,level,truncated=False):
+    '''Initialize pattern when there is no available action that could be used to split plans further
+       or when the subproblem is truncated (see LearningBudget) - actions in between borders are always a set then.'''
+    if events.enabled(events.DEBUG):
+        events.debug('leaf','No action selected at level {level}\nreturning: {actions}',level=level,actions=actionSet)
     # end of recursion
     # init pattern
     # possibilities:
@@ -156,11 +232,12 @@ def initializePattern(actionSet,plans,domainSignature,trace,level):
     # Cut off edge actions if they are just
     # dummy None actions marking beginning and end of the plan
     (leftEnd,rightEnd,recursionType,prevSplit) = trace
-    plansTrimmed = list(map(lambda p:trimPlan(p,leftEnd,rightEnd),plans))
+    # pattern needs action arguments - StoredPlan views are decoded here one by one
+    plansTrimmed = (list(trimPlan(p,leftEnd,rightEnd)) for p in plans)
 
     if len(actionSet) != 0:
         # nonempty blocks
-        if identicActionSeq(plans):
+        if (not truncated) and identicActionSeq(plans):
             # all plans has identic action sequence
             return Pattern.fromplans(plansTrimmed,domainSignature)
         else:
@@ -173,94 +250,172 @@ def initializePattern(actionSet,plans,domainSignature,trace,level):
         # there are only border actions from previous split
         return Pattern.fromplans(plansTrimmed,domainSignature)
 
+class SplitFeatures(object):
+    '''Features of candidate split actions requested by selector.selectActionStaged.
+       Per-plan action presence index is built once, block lengths are computed from action occurence indices
+       (without building the blocks) only for candidates which got through the presence filter.'''
+
+    def __init__(self,trimmedPlans,presence=None):
+        self.plans = trimmedPlans
+        # number of plans containing each action (given for plans in PlanTrie - see plantrie.triePresence)
+        if presence == None:
+            presence = dict()
+            for p in trimmedPlans:
+                for a in set(planActionNames(p)):
+                    presence[a] = presence.get(a,0) + 1
+        self.presence = presence
+        self.lengths = dict()
+
+    def __call__(self,name,actions):
+        if name == 'presence':
+            return dict([(a,len(self.plans) - self.presence.get(a,0)) for a in actions])
+        elif name == 'lengths':
+            return dict([(a,self.blockLengths(a)) for a in actions])
+        else:
+            raise ValueError('unknown feature {}'.format(name))
+
+    def blockLengths(self,action):
+        '''Return (minAcnt,maxAcnt,headLengths,middleLengths,tailLengths) of the split by action (see processPlan).'''
+        if action in self.lengths:
+            return self.lengths[action]
+        counts = []
+        (headLengths,middleLengths,tailLengths) = ([],[],[])
+        for p in self.plans:
+            aoList = getActionIndexList(action,p)
+            counts.append(len(aoList))
+            if len(aoList) == 0:
+                # head block is whole plan
+                headLengths.append(len(p))
+                continue
+            # blocks include split actions on both ends
+            headLengths.append(aoList[0] + 1)
+            for (start,end) in zip(aoList,aoList[1:]):
+                middleLengths.append(end - start + 1)
+            tailLengths.append(len(p) - aoList[-1])
+        res = (min(counts),max(counts),headLengths,middleLengths,tailLengths)
+        self.lengths[action] = res
+        return res
+
+def sampledCandidates(actionSet,features,trimmedPlans,level,trace):
+    '''Candidate actions chosen on a sample of plans (see sampling.SplitSampling).
+       Only actions present in every plan can be selected - the others are filtered out on all plans.'''
+    missing = features('presence',actionSet)
+    everywhere = [a for a in actionSet if missing[a] == 0]
+    if len(everywhere) <= sampling.top:
+        return everywhere
+    sampleIdx = sampling.sample(len(trimmedPlans),level,trace)
+    return rankActions(everywhere,SplitFeatures([trimmedPlans[i] for i in sampleIdx]),sampling.top)
+
 def makeRE(plans,domainSignature,trace,level):
+    '''Return pair (successor,pattern) learned from plans, successor is PlanRETree or set of actions (see splitNode).
+       With checkpoint set, subtrees finished by previous run are reused.'''
+    if checkpoint == None:
+        return splitNode(plans,domainSignature,trace,level)
+    path = checkpoint.enter(level,trace,plans)
+    res = checkpoint.result(path)
+    if res == None:
+        res = splitNode(plans,domainSignature,trace,level)
+    checkpoint.leave(res)
+    return res
+
+def splitNode(plans,domainSignature,trace,level):
     # plans - list of input plans with border actions included
     # level - recursion level
 
     # information about head or tail recursive call
     # leftEnd - left edge of plan
     # rightEnd - right edge of plan
-    # recursionType - head/middle/tail marked with -1/0/1
+    # recursionType - head/middle/tail marked with -1/0/1 (see retree.BRANCH_NAMES)
     # name of previous split action
     (leftEnd,rightEnd,recursionType,prevSplit) = trace
     if level == 0:
         assert leftEnd and rightEnd
 
+    # profiling is off by default (see setProfiler) - one check per phase
+    prof = profiler
+    if prof != None:
+        prof.enter(level,trace,plans)
+
     # get set of all actions in all plans except for the first and last action
     # border actions are used to connect patterns
     # there are virtual actions on plan edges we want to leave out
 
     if leftEnd and rightEnd:
-        actionSet = set([a for p in plans for (a,args) in p if a != None])
+        actionSet = set([a for p in plans for a in planActionNames(p) if a != None])
     elif leftEnd and (not rightEnd):
-        actionSet = set([a for p in plans for (a,args) in p[:-1] if a != None])
+        actionSet = set([a for p in plans for a in planActionNames(p)[:-1] if a != None])
     elif (not leftEnd) and rightEnd:
-        actionSet = set([a for p in plans for (a,args) in p[1:] if a != None])
+        actionSet = set([a for p in plans for a in planActionNames(p)[1:] if a != None])
     elif (not leftEnd) and (not rightEnd):
-        actionSet = set([a for p in plans for (a,args) in p[1:-1] if a != None])
+        actionSet = set([a for p in plans for a in planActionNames(p)[1:-1] if a != None])
 
     # returning leaf node
     if len(actionSet) == 0:
+        if prof != None:
+            prof.mark('split')
         pattern = initializePattern(actionSet,plans,domainSignature,trace,level)
+        if prof != None:
+            prof.mark('pattern')
+            prof.leave(None,0)
         return (actionSet,pattern)
     else:
         # at least one action - we need to select one
 
+        # when the budget is exhausted the subproblem is closed as trivial node (root is always split)
+        if (budget != None) and (level > 0):
+            reason = budget.exceeded(level)
+            if reason != None:
+                budget.truncate(reason,level,trace,plans,actionSet)
+                if prof != None:
+                    prof.mark('split')
+                pattern = initializePattern(actionSet,plans,domainSignature,trace,level,True)
+                if prof != None:
+                    prof.mark('pattern')
+                    prof.leave(None,len(actionSet))
+                return (actionSet,pattern)
+
         # cut off first and last action from all plans
         # those should be only split actions or dummy actions (first and last from plan)
         trimmedPlans = list(map(lambda p:trimPlan(p),plans))
 
-        actionSplitData = dict()
-        # we need to select the best action to split over all plans
-        # we make a split and record all the data - this will be scored later to select the best action
-        # only the data produced by best split action will be processed further
-        for action in actionSet:
-            # initialization of internal loop variables
-            # P.a.(R.a)*.Q
-            headList = []
-            middleList = []
-            tailList = []
-
-            # count max and min number of occurences across all plans
-            # initialize counters
-            maxAcnt = 0
-            minAcnt = max([len(p) for p in plans])
-
-            # we need total action count to disambiguate scoring
-            totalCnt = 0
-            impossibleSplit = False
-            # splitting each plan into three parts and cummulating head, middle and tail block lists
-            for plan in trimmedPlans:
-
-                actionCnt = processPlan(action,plan,headList,middleList,tailList)
-
-                totalCnt = totalCnt + actionCnt
-
-                if actionCnt > maxAcnt:
-                    maxAcnt = actionCnt
-
-                if actionCnt < minAcnt:
-                    minAcnt = actionCnt
-
-            # (minAcnt,maxAcnt,totalCnt,head,middle,tail)
-            dataPack = (minAcnt,maxAcnt,totalCnt,headList,middleList,tailList)
-
-            actionSplitData[action] = dataPack
-
-        # we use recorded data to determine which should be used for split at this level
-        action = selectAction(actionSplitData)
-
-    print('lvl {}: {}'.format(level,action))
+        # features of candidate actions are computed only when the selection needs them
+        # plans in PlanTrie (whole plans and their head blocks) share work on common prefixes
+        inTrie = hasattr(plans[0],'node')
+        features = SplitFeatures(trimmedPlans,triePresence(plans) if inTrie else None)
+        action = checkpoint.decision() if checkpoint != None else None
+        if action != None:
+            # split action recorded by previous run - candidates are not scored again
+            if prof != None:
+                prof.mark('split')
+        else:
+            candidates = actionSet
+            if (sampling != None) and (len(trimmedPlans) > sampling.size):
+                # candidates are scored on a sample, only the best ones are scored on all plans
+                candidates = sampledCandidates(actionSet,features,trimmedPlans,level,trace)
+            if prof != None:
+                prof.mark('split')
+
+            # cheap filters first, block lengths only for remaining candidates (see selector.SELECTION_STAGES)
+            action = selectActionStaged(candidates,features)
+            if prof != None:
+                prof.mark('select')
+            if (checkpoint != None) and (action != None):
+                checkpoint.decide(action)
+
+    debug = events.enabled(events.DEBUG)
+    if debug:
+        events.debug('split','lvl {level}: {action}',level=level,action=action)
 
     # no action was chosen (e.g. no common action in all plans - see selectAction)
     # returning trivial node
     if action == None:
         pattern = initializePattern(actionSet,plans,domainSignature,trace,level)
+        if prof != None:
+            prof.mark('pattern')
+            prof.leave(None,len(actionSet))
         return (actionSet,pattern)
 
-    # if changing code below check dataPack for indices
-    topMinAcnt = actionSplitData[action][0]
-    topMaxAcnt = actionSplitData[action][1]
+    (topMinAcnt,topMaxAcnt) = features.blockLengths(action)[:2]
 
 
     topHeadList = []
@@ -268,8 +423,16 @@ def makeRE(plans,domainSignature,trace,level):
     topTailList = []
 
     # splitting each plan into three parts and cummulating head, middle and tail block lists
-    for plan in plans:
-        processPlan(action,plan,topHeadList,topMiddleList,topTailList)
+    if inTrie:
+        # identical head blocks (same trie node) are extracted once
+        topHeadList = trieHeadBlocks(action,plans)
+        for plan in plans:
+            processPlan(action,plan,[],topMiddleList,topTailList)
+    else:
+        for plan in plans:
+            processPlan(action,plan,topHeadList,topMiddleList,topTailList)
+    if prof != None:
+        prof.mark('partition')
 
     assert (topMinAcnt > 0) and (topMaxAcnt > 0)
 
@@ -295,6 +458,8 @@ def makeRE(plans,domainSignature,trace,level):
     assert(middleRepetition != '')
 
     res = PlanRETree(action,level,middleRepetition)
+    if budget != None:
+        budget.addNode()
 
     patterns = []
 
@@ -305,18 +470,22 @@ def makeRE(plans,domainSignature,trace,level):
     # -1 - head recursion
     # 0 - middle recursion
     # 1 - tail recursion
-    print('--- HEAD {} ----'.format(level))
+    if debug:
+        events.debug('branch','--- HEAD {level} ----',level=level,branch='head')
     (res.head,headPattern) = makeRE(topHeadList,domainSignature,(leftEnd,False,-1,action),level+1)
 
     if len(topMiddleList) > 0:
-        print('--- MIDDLE {} ----'.format(level))
+        if debug:
+            events.debug('branch','--- MIDDLE {level} ----',level=level,branch='middle')
         (res.middle,middlePattern) = makeRE(topMiddleList,domainSignature,(False,False,0,action),level+1)
     else:
-        print('--- EMPTY MIDDLE {} ----'.format(level))
+        if debug:
+            events.debug('branch','--- EMPTY MIDDLE {level} ----',level=level,branch='middle',empty=True)
         res.middle = set()
         middlePattern = None
 
-    print('--- TAIL {} ----'.format(level))
+    if debug:
+        events.debug('branch','--- TAIL {level} ----',level=level,branch='tail')
     (res.tail,tailPattern) = makeRE(topTailList,domainSignature,(False,rightEnd,1,action),level+1)
 
     # pattern construction
@@ -330,10 +499,48 @@ def makeRE(plans,domainSignature,trace,level):
         patterns.append(tailPattern)
 
     combinedPattern = Pattern.connectPatterns(patterns,domainSignature)
+    if prof != None:
+        prof.mark('pattern')
+        prof.leave(action,len(actionSet))
 
     # returning non-trivial node
     return (res,combinedPattern)
 
+def planKey(plan):
+    '''Hashable content of the plan (StoredPlan provides digest of its stored range without decoding).'''
+    if hasattr(plan,'key'):
+        return plan.key()
+    return tuple(plan)
+
+def samePlans(a,b):
+    '''Compare plans with the same key - key of StoredPlan is only a digest.'''
+    if hasattr(a,'sameAs'):
+        return a.sameAs(b)
+    return True
+
+def collapseDuplicates(plans):
+    '''Collapse identical plans into one. Returns (uniquePlans,weights) - weights[i] is the number
+       of copies of uniquePlans[i]. Plans keep the order of their first occurence.
+       Split selection and patterns do not depend on multiplicity of plans - makeRE gets unique plans only.
+       Stored plans (CorpusStore.plans) are keyed by digest and only positions of unique plans are kept.'''
+    stored = hasattr(plans,'ids')
+    # key -> indices of unique plans with the key (more than one only for colliding digests)
+    index = {}
+    uniquePlans = []
+    weights = []
+    for (n,p) in enumerate(plans):
+        candidates = index.setdefault(planKey(p),[])
+        same = [i for i in candidates if samePlans(plans[uniquePlans[i]] if stored else uniquePlans[i],p)]
+        if len(same) > 0:
+            weights[same[0]] += 1
+        else:
+            candidates.append(len(uniquePlans))
+            uniquePlans.append(n if stored else p)
+            weights.append(1)
+    if stored:
+        uniquePlans = plans.store.plans(array('q',[plans.ids[n] for n in uniquePlans]))
+    return (uniquePlans,weights)
+
 def wrapPlans(plans,action):
     for p in plans:
         p.insert(0,action)
@@ -378,28 +585,59 @@ def  integratePattern2Stack(stack,patternCl):
 
     return newStack
 
-def processDomain(dataRoot,exprList):
-    plans = getPlansWithArgs(dataRoot,exprList)
-    domainSignature = getDomainSignature(plans)
-    # wrapPlans - add void action to the beggining and to the end of each plan
-    wrapPlans(plans,(None,None))
+def learnDomain(dataRoot,exprList,jobs=None,store=None,lower=False,trie=False,index=False):
+    '''Learn from plans in dataRoot filtered by expr (read by jobs worker processes, lowercased if lower is set).
+       If store (CorpusStore) is given the plans are taken from it instead (dataRoot is not read).
+       With index set plans get action occurence index (see planindex.py, pays off for long plans only),
+       with trie set plans are kept in prefix tree of indexed plans (see plantrie.py). Neither is used for store.
+       Returns triple (reTree,pattern,combinedStack).'''
+    if store != None:
+        # stored plans are memory-mapped views with border actions already in place
+        plans = store.plans()
+        domainSignature = dict(store.signature)
+    else:
+        plans = getPlansWithArgs(dataRoot,exprList,jobs,lower)
+        domainSignature = getDomainSignature(plans)
+        # wrapPlans - add void action to the beggining and to the end of each plan
+        wrapPlans(plans,(None,None))
+    # identical plans are processed only once
+    (plans,weights) = collapseDuplicates(plans)
+    if (store == None) and (index or trie):
+        # sub-plans on all levels are views of indexed plans (see planindex.py)
+        plans = indexPlans(plans)
+        if trie:
+            plans = triePlans(plans)
+    events.info('plans','{unique} unique plans ({total} plans in total)',unique=len(plans),total=sum(weights))
     # plans .. list of plans
     # domainSignature .. map of possible actions with their argument count
     # (leftEnd, rightEnd, recursionType, prevSplit) .. information about previous recursive call
     # level = 0 .. recursion level
+    if checkpoint != None:
+        checkpoint.bindCorpus(map(planActionNames,plans),weights)
     (reTree,pattern) = makeRE(plans,domainSignature,(True,True,0,None),0)
-
-    # DEBUG printout
-    print('=== Tree walk ===')
-    reTree.walkTree(0)
-    print('=== Pattern ( length = {}, noneCnt = {}) ==='.format(len(pattern.__repr__()),pattern.__repr__().count(None)))
-    print(pattern)
-    print('=== labelActions ===')
+    if checkpoint != None:
+        checkpoint.save()
+
+    debug = events.enabled(events.DEBUG)
+    if debug:
+        treeWalk = io.StringIO()
+        reTree.walkTree(0,treeWalk)
+        events.debug('tree','=== Tree walk ===\n{walk}',walk=treeWalk.getvalue().rstrip('\n'))
+        patternList = pattern.__repr__()
+        events.debug('pattern','=== Pattern ( length = {length}, noneCnt = {noneCnt}) ===\n{pattern}',
+                     length=len(patternList),noneCnt=patternList.count(None),pattern=pattern)
+        events.debug('labels','=== labelActions ===')
     reTree.labelActions()
-    print('=== tree stack ===')
     reStack = reTree.__repr__()
-    print(reStack)
-    print('=== stack with arguments ===')
+    events.info('result','learned tree: depth {depth}, {nodes} split nodes, expression of {length} items',
+                depth=reTree.depth(),nodes=reTree.nodeCount(),length=len(reStack))
+    if debug:
+        events.debug('stack','=== tree stack ===\n{stack}',stack=reStack)
     combinedStack = integratePattern2Stack(reStack,pattern)
-    print(combinedStack)
+    if debug:
+        events.debug('combinedStack','=== stack with arguments ===\n{stack}',stack=combinedStack)
+    return (reTree,pattern,combinedStack)
+
+def processDomain(dataRoot,exprList,jobs=None,store=None,lower=False):
+    (reTree,pattern,combinedStack) = learnDomain(dataRoot,exprList,jobs,store,lower)
     return combinedStack
@@ -1,5 +1,10 @@
 from itertools import chain
 
+import events
+
+# recursion type of makeRE call (trace[2], see refle.splitNode) -> branch of the parent node holding its result
+BRANCH_NAMES = {-1:'head',0:'middle',1:'tail'}
+
 class PlanRETree(object):
 
     index = 0
@@ -62,52 +67,97 @@ class PlanRETree(object):
         else:
             return False
 
-    def walkTree(self,indent):
+    def depth(self):
+        '''Number of split levels in the tree (leaf sets are not counted).'''
+        return 1 + max([s.depth() if isinstance(s,PlanRETree) else 0 for s in (self._head,self._middle,self._tail)])
+
+    def nodeCount(self):
+        '''Number of split nodes in the tree.'''
+        return 1 + sum([s.nodeCount() for s in (self._head,self._middle,self._tail) if isinstance(s,PlanRETree)])
+
+    @staticmethod
+    def succToDict(succ):
+        '''Successor is either PlanRETree, set of actions or None.'''
+        if isinstance(succ,PlanRETree):
+            return succ.toDict()
+        elif isinstance(succ,set):
+            return {'set':sorted(succ)}
+        else:
+            return None
+
+    @staticmethod
+    def succFromDict(data):
+        if data == None:
+            return None
+        elif 'set' in data:
+            return set(data['set'])
+        else:
+            return PlanRETree.fromDict(data)
+
+    def toDict(self):
+        '''Return JSON compatible description of the tree (see model.py).'''
+        return {'action':self._action,
+                'level':self._level,
+                'middleRep':self._middleRep,
+                'head':PlanRETree.succToDict(self._head),
+                'middle':PlanRETree.succToDict(self._middle),
+                'tail':PlanRETree.succToDict(self._tail)}
+
+    @staticmethod
+    def fromDict(data):
+        '''Initialize tree from description produced by toDict.'''
+        res = PlanRETree(data['action'],data['level'],data['middleRep'])
+        res.head = PlanRETree.succFromDict(data['head'])
+        res.middle = PlanRETree.succFromDict(data['middle'])
+        res.tail = PlanRETree.succFromDict(data['tail'])
+        return res
+
+    def walkTree(self,indent,out=None):
         prefix = " "*indent
         # terminate recursion
         if self.allSuccEmptySet():
-            print("{}{}.".format(prefix,self._action))
+            print("{}{}.".format(prefix,self._action),file=out)
             return
 
         # ---- HEAD ----
         if isinstance(self._head,set):
             if len(self._head) > 0:
-                print("{}{}".format(prefix,self._head))
+                print("{}{}".format(prefix,self._head),file=out)
             #else:
             #    print("{}<empty HEAD set>".format(prefix))
         elif isinstance(self._head,PlanRETree):
-            self._head.walkTree(indent+1)
+            self._head.walkTree(indent+1,out)
 
         # ---- MIDDLE ----
         if isinstance(self._middle,set):
             if len(self._middle) > 0:
                 # print split action twice
 
-                print("{}{}".format(prefix,self._action))
-                print("{}({}".format(prefix,self._middle))
-                print("{}{}){}".format(prefix,self._action,self._middleRep))
+                print("{}{}".format(prefix,self._action),file=out)
+                print("{}({}".format(prefix,self._middle),file=out)
+                print("{}{}){}".format(prefix,self._action,self._middleRep),file=out)
             else:
                 # print split action only once
-                print("{}{}".format(prefix,self._action))
+                print("{}{}".format(prefix,self._action),file=out)
         elif isinstance(self._middle,PlanRETree):
             # print split action twice
-            print("{}{}".format(prefix,self._action))
-            self._middle.walkTree(indent+1)
-            print("{}{}".format(prefix,self._action))
+            print("{}{}".format(prefix,self._action),file=out)
+            self._middle.walkTree(indent+1,out)
+            print("{}{}".format(prefix,self._action),file=out)
 
         # ---- TAIL ----
         if isinstance(self._tail,set):
             if len(self._tail) > 0:
-                print("{}{}".format(prefix,self._tail))
+                print("{}{}".format(prefix,self._tail),file=out)
             #else:
             #    print("{}<empty TAIL set>".format(prefix))
         elif isinstance(self._tail,PlanRETree):
-            self._tail.walkTree(indent+1)
+            self._tail.walkTree(indent+1,out)
 
     def labelActions(self):
         # terminate recursion
         if self.allSuccSet():
-            print("{} : {}".format(self._action,PlanRETree.index))
+            events.debug('label','{action} : {index}',action=self._action,index=PlanRETree.index)
             PlanRETree.index = PlanRETree.index + 1
             return
 
@@ -115,17 +165,17 @@ class PlanRETree(object):
         if isinstance(self._head,PlanRETree):
             self._head.labelActions()
 
-        print("{} : {}".format(self._action,PlanRETree.index))
+        events.debug('label','{action} : {index}',action=self._action,index=PlanRETree.index)
         PlanRETree.index = PlanRETree.index + 1
 
         # ---- MIDDLE ----
         if isinstance(self._middle,PlanRETree):
             self._middle.labelActions()
-            print("{} : {}".format(self._action,PlanRETree.index))
+            events.debug('label','{action} : {index}',action=self._action,index=PlanRETree.index)
             PlanRETree.index = PlanRETree.index + 1
         elif isinstance(self._middle,set):
             if len(self._middle) > 0:
-                print("{} : {}".format(self._action,PlanRETree.index))
+                events.debug('label','{action} : {index}',action=self._action,index=PlanRETree.index)
                 PlanRETree.index = PlanRETree.index + 1
 
         # ---- TAIL ----
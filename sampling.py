@@ -0,0 +1,26 @@
+import random
+
+class SplitSampling(object):
+    '''Approximate split selection (enable by refle.setSampling).
+       Candidate actions of nodes with more than size plans are scored on a random sample of size plans,
+       only top best ranked candidates are scored on all plans and selector.selectActionStaged chooses among them.
+       Actions which are not present in every plan are filtered out exactly before sampling
+       and repetition markers come from the full split of the selected action.
+       size .. number of sampled plans
+       top .. number of candidates verified on all plans
+       seed .. random seed - sample of a node depends only on the seed and the node (level and trace),
+               so the learned tree does not depend on the order in which nodes are processed'''
+
+    def __init__(self,size,top=3,seed=0):
+        assert (size > 0) and (top > 0)
+        self.size = size
+        self.top = top
+        self.seed = seed
+        # number of sampled nodes
+        self.nodes = 0
+
+    def sample(self,planCnt,level,trace):
+        '''Return sorted indices of sampled plans of the node.'''
+        self.nodes += 1
+        rnd = random.Random('{}:{}:{}:{}'.format(self.seed,level,trace,planCnt))
+        return sorted(rnd.sample(range(planCnt),self.size))
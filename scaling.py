@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+import json
+import math
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+# option parsing
+from optparse import OptionParser
+
+import events
+import refle
+from FSA import FSA
+from plangen import generatePlans
+from readplans import writeCorpus
+from retree import PlanRETree
+
+# Scaling study of the whole learning pipeline:
+#   corpus file -> refle.learnDomain -> FSA.initFromStack
+# Every point (number of plans, plan length) runs in a fresh python process,
+# so peak RSS of the point is not influenced by the previous ones.
+
+def runPoint(planCnt,length,options):
+    '''Generate corpus, learn FSA and return measured values (called in the child process).'''
+    # ru_maxrss is in kilobytes on Linux, memory of interpreter and imported modules is subtracted
+    baseRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    plans = generatePlans(planCnt,options.actions,options.arity,length,options.repeat,options.objects,options.seed)
+    actionCnt = sum([len(p) for p in plans])
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        corpusFile = os.path.join(tmpDir,'plans.jsonl')
+        writeCorpus([('plan{}'.format(i),p) for (i,p) in enumerate(plans)],corpusFile)
+        del plans
+
+        # progress events of learning are not part of the result
+        events.configure([])
+        start = time.perf_counter()
+        (reTree,pattern,stack) = refle.learnDomain(corpusFile,re.compile('..*'),options.jobs)
+        learned = time.perf_counter()
+        A = FSA.initFromStack(stack)
+        end = time.perf_counter()
+
+    peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    isTree = isinstance(reTree,PlanRETree)
+    return {'plans':planCnt,
+            'length':length,
+            'actions':actionCnt,
+            'learnSeconds':learned - start,
+            'fsaSeconds':end - learned,
+            'seconds':end - start,
+            'peakRSS':peakRSS,
+            'learnRSS':peakRSS - baseRSS,
+            'treeDepth':reTree.depth() if isTree else 0,
+            'treeNodes':reTree.nodeCount() if isTree else 0,
+            'states':len(A.states),
+            'transitions':len(A.transitions)}
+
+def childArgs(planCnt,length,options):
+    args = [sys.executable,os.path.abspath(__file__),'--point','{},{}'.format(planCnt,length)]
+    for opt in ('actions','arity','repeat','objects','seed','jobs'):
+        args.append('--{}={}'.format(opt,getattr(options,opt)))
+    return args
+
+def measurePoint(planCnt,length,options):
+    '''Run one point in a child process.'''
+    res = subprocess.run(childArgs(planCnt,length,options),stdout=subprocess.PIPE,check=True)
+    return json.loads(res.stdout.decode().splitlines()[-1])
+
+def geometric(start,factor,steps):
+    return [int(round(start * factor**i)) for i in range(steps)]
+
+def fitExponent(xs,ys):
+    '''Least squares slope of log(ys) against log(xs) - y ~ c*x^k returns k (None for less than 2 points).'''
+    pts = [(math.log(x),math.log(y)) for (x,y) in zip(xs,ys) if (x > 0) and (y > 0)]
+    if len(pts) < 2:
+        return None
+    mx = sum([x for (x,y) in pts]) / len(pts)
+    my = sum([y for (x,y) in pts]) / len(pts)
+    var = sum([(x - mx)**2 for (x,y) in pts])
+    if var == 0:
+        return None
+    return sum([(x - mx)*(y - my) for (x,y) in pts]) / var
+
+def fitSeries(points,key,fixed):
+    '''Fit exponents of measured values along key (plans or length) with the other parameter fixed.'''
+    other = 'length' if key == 'plans' else 'plans'
+    series = sorted([p for p in points if p[other] == fixed],key=lambda p:p[key])
+    xs = [p[key] for p in series]
+    return dict([(value,fitExponent(xs,[p[value] for p in series])) for value in ('seconds','learnRSS','states','transitions')])
+
+def printTable(points,fits):
+    columns = ('plans','length','actions','seconds','learnSeconds','fsaSeconds','peakRSS','learnRSS','treeDepth','treeNodes','states','transitions')
+    print(' '.join(['{:>12}'.format(c) for c in columns]))
+    for p in points:
+        row = []
+        for c in columns:
+            if isinstance(p[c],float):
+                row.append('{:12.4f}'.format(p[c]))
+            elif c in ('peakRSS','learnRSS'):
+                row.append('{:>10}MB'.format(p[c] // (1024*1024)))
+            else:
+                row.append('{:>12}'.format(p[c]))
+        print(' '.join(row))
+
+    print()
+    print('fitted exponents (value ~ size^k)')
+    for (key,fit) in fits.items():
+        print('{:>12}: '.format(key) + ' '.join(['{}={}'.format(v,'-' if k == None else '{:.2f}'.format(k)) for (v,k) in sorted(fit.items())]))
+
+def main():
+    usage = "usage: %prog [options]\n\nLearn FSA from generated corpora of geometric series of sizes and plan lengths and fit complexity exponents."
+    parser = OptionParser(usage=usage)
+
+    parser.add_option("-n", "--plans", dest="plans", type="int", default=100,
+                      help="Smallest number of plans.")
+    parser.add_option("-N", "--plan-steps", dest="planSteps", type="int", default=5,
+                      help="Number of corpus sizes.")
+    parser.add_option("-L", "--length", dest="length", type="int", default=10,
+                      help="Smallest plan structure length (see plangen.py).")
+    parser.add_option("-S", "--length-steps", dest="lengthSteps", type="int", default=3,
+                      help="Number of plan lengths.")
+    parser.add_option("-x", "--factor", dest="factor", type="float", default=2.0,
+                      help="Ratio of consecutive sizes and lengths.")
+    parser.add_option("-a", "--actions", dest="actions", type="int", default=5,
+                      help="Number of action types.")
+    parser.add_option("-k", "--arity", dest="arity", type="int", default=3,
+                      help="Number of arguments of each action.")
+    parser.add_option("-R", "--repeat", dest="repeat", type="int", default=4,
+                      help="Maximal number of body repetitions.")
+    parser.add_option("-O", "--objects", dest="objects", type="int", default=50,
+                      help="Size of the object pool.")
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=0,
+                      help="Random seed.")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=1,
+                      help="Number of worker processes used for reading plans.")
+    parser.add_option("-o", "--output", dest="outFile", metavar="OUT", default=None,
+                      help="Write JSON results to OUT.")
+    parser.add_option("--point", dest="point", metavar="PLANS,LENGTH", default=None,
+                      help="Measure one point in this process and print JSON result (used internally).")
+
+    (options, args) = parser.parse_args()
+
+    if options.point != None:
+        (planCnt,length) = [int(x) for x in options.point.split(',')]
+        print(json.dumps(runPoint(planCnt,length,options)))
+        return
+
+    planSizes = geometric(options.plans,options.factor,options.planSteps)
+    lengths = geometric(options.length,options.factor,options.lengthSteps)
+
+    # corpus sizes with the smallest length and lengths with the smallest corpus
+    grid = [(n,lengths[0]) for n in planSizes] + [(planSizes[0],l) for l in lengths[1:]]
+    points = []
+    for (n,l) in grid:
+        print('plans={} length={}'.format(n,l),file=sys.stderr,flush=True)
+        points.append(measurePoint(n,l,options))
+
+    fits = {'plans':fitSeries(points,'plans',lengths[0]),
+            'length':fitSeries(points,'length',planSizes[0])}
+
+    printTable(points,fits)
+
+    if options.outFile != None:
+        with open(options.outFile,'w',encoding='utf-8') as outFile:
+            json.dump({'parameters':vars(options),'points':points,'exponents':fits},outFile,indent=1)
+
+if __name__ == "__main__":
+    main()
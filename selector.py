@@ -58,7 +58,7 @@ def minLength(planList):
         return 0
 
 ########## scoring functions ########
-# data dictionary: {action: (minAcnt,maxAcnt,totalCnt,patterns,head,middle,tail)}
+# data dictionary: {action: (minAcnt,maxAcnt,totalCnt,head,middle,tail)}
 
 def atLeastOnceEverywhere(action,data):
     if data[action][0] > 0:
@@ -74,7 +74,7 @@ def objectFocus(action,data):
     '''Count number of different objects referenced in the plan.
     Low count should indicate that plan is focused on small set of objects.'''
     middleList = data[action][4]
-    return differentObjectCount(middleList) 
+    return differentObjectCount(middleList)
 
 def minLengthSum(action,data):
     minLenHead = minLength(data[action][3])
@@ -91,6 +91,66 @@ def maxOccurence(action,data):
 def totalOccurence(action,data):
     return data[action][2]
 
+########## staged selection ########
+# Candidates are filtered and disambiguated in stages, each stage needs one feature of the candidates.
+# Features are computed by the caller only for actions still alive in the stage (see refle.SplitFeatures),
+# so split data of the candidates removed by the cheap presence filter are never built.
+# presence .. number of plans without the action (per-plan action presence index)
+# lengths .. (minAcnt,maxAcnt,headLengths,middleLengths,tailLengths) - block lengths of the split by the action
+
+def missingPlans(action,data):
+    return data[action]
+
+def middleLengthVariance(action,data):
+    # same as middleListVariance
+    return len(set(data[action][3]))
+
+def minBlockLengthSum(action,data):
+    # same as minLengthSum
+    return sum([min(lengths) if len(lengths) > 0 else 0 for lengths in data[action][2:5]])
+
+# stages of action selection: (feature,scoreFunction,maximize,treshold) - stages with treshold are filters
+# objectFocus could replace middleLengthVariance (it would need middle blocks as a feature)
+SELECTION_STAGES = (('presence',missingPlans,False,0),
+                    ('lengths',middleLengthVariance,False,None),
+                    ('lengths',minBlockLengthSum,False,None))
+
+def selectActionStaged(actions,features):
+    '''Select one action from actions (None if no action passes filters).
+       features(name,actionList) returns dictionary action -> feature for actions in actionList.
+       Disambiguation stops as soon as one action remains, ties after the last stage are decided by lexicographic order.'''
+    alive = list(actions)
+    for (name,scoreFunction,maximize,treshold) in SELECTION_STAGES:
+        if (treshold == None) and (len(alive) == 1):
+            break
+        alive = selectTopSubset(features(name,alive),scoreFunction,alive,maximize,treshold)
+        if len(alive) == 0:
+            return None
+    return sorted(alive)[0]
+
+def rankActions(actions,features,count=None):
+    '''Return count best actions (all actions if count is None), best first - the order of preference of selectActionStaged.
+       Used to choose candidates scored on a sample of plans (see sampling.SplitSampling).'''
+    actions = list(actions)
+    keys = dict([(a,[]) for a in actions])
+    for (name,scoreFunction,maximize,treshold) in SELECTION_STAGES:
+        data = features(name,actions)
+        for a in actions:
+            score = scoreFunction(a,data)
+            keys[a].append(-score if maximize else score)
+    return sorted(actions,key=lambda a:(keys[a],a))[:count]
+
+def splitDataFeatures(actionSplitData):
+    '''Features of staged selection computed from recorded split data (see selectAction).'''
+    def features(name,actions):
+        if name == 'presence':
+            # recorded data tell only whether the action is missing in some plan
+            return dict([(a,0 if actionSplitData[a][0] > 0 else 1) for a in actions])
+        else:
+            return dict([(a,actionSplitData[a][:2] + tuple([[len(b) for b in blocks] for blocks in actionSplitData[a][3:6]]))
+                         for a in actions])
+    return features
+
 def selectAction(actionSplitData):
     '''Select one action based on actionSplitData
     actionSplitData = {'action1':data_action1,action2:data_action2,...}
@@ -101,30 +161,6 @@ def selectAction(actionSplitData):
     headList ... list of subplans from beginning of plans (see refle.py processPlan and splitPlan)
     middleList ... list of subplans from middle of plans
     tailList ... list of subplans from tails of plans
+    Actions are filtered and disambiguated by SELECTION_STAGES (see selectActionStaged).
     '''
-    # TODO: maybe we should use stack of scoring functions for disambiguation
-
-    actionSet = actionSplitData.keys()
-
-    ## filters ##
-
-    # select actions occuring at least once in every plan
-    topActions = selectTopSubset(actionSplitData,atLeastOnceEverywhere,actionSet,maximize=True,treshold=1)
-    if len(topActions) == 0:
-        # if there are no such actions selection failed
-        return None
-    else:
-        # disambiguation1
-        topActionsD1 = selectTopSubset(actionSplitData,middleListVariance,topActions,maximize=False)
-        #topActionsD1 = selectTopSubset(actionSplitData,objectFocus,topActions,maximize=False)
-        if len(topActionsD1) == 1:
-            # there is only one action in the set
-            return topActionsD1[0]
-        else:
-            topActionsD2 = selectTopSubset(actionSplitData,minLengthSum,topActionsD1,maximize=False)
-            if len(topActionsD2) == 1:
-                return topActionsD2[0]
-            else:
-                # we can possibly disambiguate further - for now we let lexicographic order decide
-                topASorted = sorted(topActionsD2)
-                return topASorted[0]
+    return selectActionStaged(actionSplitData.keys(),splitDataFeatures(actionSplitData))
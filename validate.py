@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from readplans import getPlanFiles, readPlan, isCorpus, iterCorpus
+from model import loadModel
+from fsacodegen import loadMatcher
+
+# automaton used by the worker process (see initWorker)
+# FSA or generated matcher module - both provide simulate(actionNames)
+workerFSA = None
+
+def initWorker(modelFile):
+    '''Load the model once in each worker process.
+       Python files are treated as matchers generated by fsacodegen.py.'''
+    global workerFSA
+    if modelFile.endswith('.py'):
+        workerFSA = loadMatcher(modelFile)
+    else:
+        workerFSA = loadModel(modelFile)
+
+def checkPlan(fsa,plan):
+    '''Check one plan against the automaton (FSA or generated matcher).
+       Returns (accepted,deviation,stateList,planLength) - see FSA.simulate'''
+    (accepted,deviation,stateList) = fsa.simulate([a for (a,args) in plan])
+    return (accepted,deviation,stateList,len(plan))
+
+def checkPlanFile(path,lower=False):
+    '''Read and check one plan file in the worker process.'''
+    return checkPlan(workerFSA,readPlan(path,lower))
+
+def checkPlanData(plan):
+    '''Check one plan read from corpus container in the worker process.'''
+    return checkPlan(workerFSA,plan)
+
+def validatePlans(modelFile,dataRoot,exprList,jobs=None,out=None,lower=False):
+    '''Check all plans found in the dataRoot (plan directory or corpus container) filtered by expr against saved model.
+       One JSON object per plan is written to out (standard output by default) as soon as it is checked:
+       {"plan": name, "accepted": bool, "deviation": index or null, "states": [stateIDs]}
+       The last line holds throughput statistics: {"summary": {...}}'''
+    if out == None:
+        out = sys.stdout
+    if isCorpus(dataRoot):
+        # container is read once here, workers only check the plans
+        named = list(iterCorpus(dataRoot,exprList,lower))
+        files = [name for (name,plan) in named]
+        items = [plan for (name,plan) in named]
+        checkFunction = checkPlanData
+    else:
+        files = getPlanFiles(dataRoot,exprList)
+        items = [os.path.join(dataRoot,f) for f in files]
+        checkFunction = partial(checkPlanFile,lower=lower)
+
+    if jobs == None:
+        jobs = os.cpu_count() or 1
+    # keep workers busy without holding all the results back
+    chunkSize = max(1,len(items) // (jobs*16))
+
+    acceptedCnt = 0
+    actionCnt = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs,initializer=initWorker,initargs=(modelFile,)) as pool:
+        results = pool.map(checkFunction,items,chunksize=chunkSize)
+        for (f,(accepted,deviation,stateList,planLen)) in zip(files,results):
+            if accepted:
+                acceptedCnt += 1
+            actionCnt += planLen
+            record = {'plan':f,'accepted':accepted,'deviation':deviation,'states':stateList}
+            print(json.dumps(record),file=out,flush=True)
+    elapsed = time.perf_counter() - start
+
+    planCnt = len(items)
+    summary = {'plans':planCnt,
+               'accepted':acceptedCnt,
+               'rejected':planCnt - acceptedCnt,
+               'actions':actionCnt,
+               'jobs':jobs,
+               'seconds':round(elapsed,6),
+               'plansPerSecond':round(planCnt / elapsed,3) if elapsed > 0 else None,
+               'actionsPerSecond':round(actionCnt / elapsed,3) if elapsed > 0 else None}
+    print(json.dumps({'summary':summary}),file=out,flush=True)
+
+    return summary